@@ -0,0 +1,84 @@
+import copy
+from functools import partial
+from hashlib import sha256
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from common.constants import (AUTH_TOKEN_CACHE_TIMEOUT, AUTH_TOKEN_LRU_SIZE,
+                              AUTH_TOKEN_LRU_TIMEOUT)
+from common.lru import LRUCache
+
+users = LRUCache(AUTH_TOKEN_LRU_SIZE, timeout=AUTH_TOKEN_LRU_TIMEOUT)
+
+
+def get_cache_key(key):
+    # Tokens are credentials, so only their digests reach the cache.
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def forget_token(key):
+    users.delete(key)
+    cache.delete(get_cache_key(key))
+
+
+def forget_user_tokens(user):
+    for key in Token.objects.filter(user=user).values_list('key', flat=True):
+        forget_token(key)
+
+
+def deactivate_users(users):
+    """Deactivates a queryset of users and evicts their tokens.
+
+    ``QuerySet.update()`` sends no signals, so users deactivated with it
+    keep authenticating from the caches for AUTH_TOKEN_CACHE_TIMEOUT.
+    """
+    with transaction.atomic():
+        keys = list(Token.objects.filter(user__in=users).values_list(
+            'key', flat=True))
+        users.update(is_active=False)
+        # After the commit, so the users are not cached again as active.
+        for key in keys:
+            transaction.on_commit(partial(forget_token, key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication resolving users from the caches first.
+
+    Users are looked up in the process LRU, then in the shared cache,
+    and only then in the database. The signals in ``api.signals`` evict
+    them when a token is deleted or a user is saved; users changed with
+    ``QuerySet.update()`` are not, deactivate them with
+    ``deactivate_users()``. The users are snapshots for reading, loaded
+    without the password hash; views changing the user save a fresh row.
+    """
+
+    def authenticate_credentials(self, key):
+        user = users.get(key)
+        if user is None:
+            cache_key = get_cache_key(key)
+            user = cache.get(cache_key)
+            if user is None:
+                user = self.get_user(key)
+                cache.set(cache_key, user, AUTH_TOKEN_CACHE_TIMEOUT)
+            users.set(key, user)
+
+        # Views may change request.user, the LRU entry must stay intact.
+        user = copy.copy(user)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, Token(key=key, user=user)
+
+    def get_user(self, key):
+        # The hash stays out of the shared cache; it is loaded on access.
+        try:
+            token = self.get_model().objects.select_related('user').defer(
+                'user__password').get(key=key)
+        except self.get_model().DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+        return token.user
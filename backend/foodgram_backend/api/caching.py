@@ -0,0 +1,129 @@
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag, urlencode
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from common.constants import CATALOG_CACHE_TIMEOUT, CATALOG_MAX_AGE
+
+from .metrics import registry
+
+
+def get_cache_version(namespace):
+    # Versions start from the current time, so a version evicted from the
+    # cache never restarts at a value older entries were stored under.
+    return cache.get_or_set(
+        f'cache-version:{namespace}', time.time_ns(), None)
+
+
+def bump_cache_version(namespace):
+    key = f'cache-version:{namespace}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def record_cache_access(namespace, hit):
+    registry.inc('foodgram_cache_requests_total', (
+        ('namespace', namespace), ('result', 'hit' if hit else 'miss')))
+
+
+def get_cache_stats(namespace):
+    """Hits and misses of a namespace, summed over the processes sharing
+    METRICS_DIR."""
+    counters, _ = registry.collect()
+    return tuple(
+        counters.get(('foodgram_cache_requests_total', (
+            ('namespace', namespace), ('result', result))), 0)
+        for result in ('hit', 'miss'))
+
+
+class CachedResponseMixin:
+    """Caches pre-rendered JSON of the viewset's list and retrieve actions.
+
+    Entries are keyed by path and query params under a version of
+    ``cache_namespace``; bumping that version (see ``api.signals``)
+    invalidates them. Responses carry an ETag and Cache-Control so
+    clients and proxies can revalidate with If-None-Match, and an X-Cache
+    header telling whether the cache was hit.
+    """
+    cache_namespace = None
+    cache_timeout = CATALOG_CACHE_TIMEOUT
+    cache_max_age = CATALOG_MAX_AGE
+    cache_vary_headers = ('Accept',)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_response_cache_key(self, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        signature = md5(f'{request.path}?{query}'.encode()).hexdigest()
+        version = get_cache_version(self.cache_namespace)
+        return f'response:{self.cache_namespace}:{version}:{signature}'
+
+    def should_cache_response(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def get_shared_response(self, view, request, *args, **kwargs):
+        """Renders the response stored in the cache for every client."""
+        return view(request, *args, **kwargs)
+
+    def personalize_content(self, request, content):
+        """Returns content adapted to the client, or None to serve as is."""
+        return None
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        if not self.should_cache_response(request):
+            return view(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        hit = cached is not None
+        record_cache_access(self.cache_namespace, hit)
+
+        if not hit:
+            response = self.get_shared_response(
+                view, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            if isinstance(response, Response):
+                content = JSONRenderer().render(response.data)
+            else:
+                content = response.content
+
+            cached = (content, quote_etag(md5(content).hexdigest()))
+            cache.set(key, cached, self.cache_timeout)
+
+        content, etag = cached
+
+        personal_content = self.personalize_content(request, content)
+        if personal_content is not None:
+            content = personal_content
+            etag = quote_etag(md5(content).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+
+        response['ETag'] = etag
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        if personal_content is None:
+            patch_cache_control(response, public=True,
+                                max_age=self.cache_max_age)
+        else:
+            patch_cache_control(response, private=True,
+                                max_age=self.cache_max_age)
+        patch_vary_headers(response, self.cache_vary_headers)
+        return response
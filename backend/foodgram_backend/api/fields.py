@@ -1,18 +1,144 @@
 import base64
+import re
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from PIL import Image
 from rest_framework import serializers
 
+from common.constants import (BASE64_CHUNK_SIZE, IMAGE_UPLOAD_FORMATS,
+                              IMAGE_UPLOAD_MAX_PIXELS, IMAGE_UPLOAD_MAX_SIZE)
 from common.help_functions import generate_random_filename
+from common.images import get_rendition_urls
+
+DATA_URI_HEADER = re.compile(r'data:image/([\w.+-]+);base64')
+DATA_URI_HEADER_MAX_LENGTH = 64
 
 
 class Base64ImageField(serializers.ImageField):
+    """Image field that also accepts ``data:image/...;base64,`` strings.
+
+    The payload is decoded in chunks straight into an uploaded file, kept
+    in memory or spooled to disk like regular uploads. The declared type,
+    the decoded size and the pixel count (read from the image header as
+    soon as it is decoded) are checked before the rest is decoded.
+    """
+    default_error_messages = {
+        'invalid_mime': 'Unsupported image type. Allowed types: {formats}.',
+        'invalid_base64': 'Invalid base64 image data.',
+        'mime_mismatch': 'Image data does not match the declared type.',
+        'max_size': 'Image is too large. Maximum size is {max_size} bytes.',
+        'max_pixels': ('Image is too large. '
+                       'Maximum is {max_pixels} pixels.'),
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop('max_size', IMAGE_UPLOAD_MAX_SIZE)
+        self.max_pixels = kwargs.pop('max_pixels', IMAGE_UPLOAD_MAX_PIXELS)
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            data = self.decode(data)
+        return super().to_internal_value(data)
 
-            data = ContentFile(base64.b64decode(imgstr),
-                               name=generate_random_filename() + '.' + ext)
+    def decode(self, data):
+        header_end = data.find(',', 0, DATA_URI_HEADER_MAX_LENGTH)
+        match = DATA_URI_HEADER.fullmatch(data, 0, max(header_end, 0))
+        if match is None:
+            self.fail('invalid_base64')
 
-        return super().to_internal_value(data)
+        ext = match.group(1).lower()
+        if ext not in IMAGE_UPLOAD_FORMATS:
+            self.fail('invalid_mime', formats=', '.join(IMAGE_UPLOAD_FORMATS))
+
+        start = header_end + 1
+        length = len(data) - start
+        if not length or length % 4:
+            self.fail('invalid_base64')
+        size = length // 4 * 3 - (
+            2 if data.endswith('==') else 1 if data.endswith('=') else 0)
+        if size > self.max_size:
+            self.fail('max_size', max_size=self.max_size)
+
+        upload = self.create_upload(
+            f'{generate_random_filename()}.{ext}', f'image/{ext}', size)
+        checked = False
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = data[offset:offset + BASE64_CHUNK_SIZE]
+                # Chunks decode on their own, so padding followed by more
+                # data is only noticed by looking for it.
+                if '=' in chunk and offset + BASE64_CHUNK_SIZE < len(data):
+                    self.fail('invalid_base64')
+                try:
+                    upload.write(base64.b64decode(chunk, validate=True))
+                except ValueError:
+                    self.fail('invalid_base64')
+                if not checked:
+                    checked = self.check_header(upload.file, ext)
+            if not checked:
+                self.check_header(upload.file, ext, complete=True)
+        except Exception:
+            upload.close()
+            raise
+
+        upload.seek(0)
+        return upload
+
+    def create_upload(self, name, content_type, size):
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            return TemporaryUploadedFile(name, content_type, size, None)
+        return InMemoryUploadedFile(
+            BytesIO(), None, name, content_type, size, None)
+
+    def check_header(self, file, ext, complete=False):
+        """Check type and dimensions once the header is decoded.
+
+        Returns False while the decoded part is too short to tell.
+        """
+        position = file.tell()
+        file.seek(0)
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.fail('max_pixels', max_pixels=self.max_pixels)
+        except Exception:
+            if complete:
+                self.fail('invalid_image')
+            return False
+        finally:
+            file.seek(position)
+
+        if image.format != IMAGE_UPLOAD_FORMATS[ext]:
+            self.fail('mime_mismatch')
+        width, height = image.size
+        if width * height > self.max_pixels:
+            self.fail('max_pixels', max_pixels=self.max_pixels)
+        return True
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """URLs of the resized copies of an image field, by size and format.
+
+    None while the renditions are still being generated.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        urls = get_rendition_urls(value.name)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+
+        return {
+            rendition: {
+                extension: request.build_absolute_uri(url)
+                for extension, url in formats.items()
+            }
+            for rendition, formats in urls.items()
+        }
@@ -1,6 +1,7 @@
 from django_filters import rest_framework as filters
 
 from recipe.models import Ingredient, Recipe, Tag
+from recipe.search import search_recipes
 
 
 class IngredientFilter(filters.FilterSet):
@@ -21,10 +22,12 @@ class RecipeFilter(filters.FilterSet):
         method='filter_favorites')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'is_favorited', 'is_in_shopping_cart', 'author')
+        fields = ('tags', 'is_favorited', 'is_in_shopping_cart', 'author',
+                  'search')
 
     def filter_favorites(self, queryset, name, value):
         if value:
@@ -39,3 +42,8 @@ class RecipeFilter(filters.FilterSet):
                 return queryset.none()
             return queryset.filter(shopping_cart_items__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
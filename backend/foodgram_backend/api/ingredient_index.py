@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+
+from common.constants import INGREDIENT_INDEX_MAX_AGE, INGREDIENT_SEARCH_LIMIT
+from recipe.models import Ingredient
+
+from .caching import get_cache_version
+from .serializers import IngredientSerializer
+
+
+class IngredientIndex:
+    """Process-local prefix index over the ingredient catalog.
+
+    Keeps ingredient names sorted in lower case alongside pre-serialized
+    JSON, so autocomplete queries are answered by a binary search instead
+    of an ILIKE scan. The index is built on first use and rebuilt after
+    invalidation, once it is older than ``max_age`` seconds, or when the
+    ``'ingredients'`` cache version differs from the one it was built at,
+    which lets it pick up catalog changes made by other processes.
+    """
+
+    def __init__(self, max_age=INGREDIENT_INDEX_MAX_AGE,
+                 limit=INGREDIENT_SEARCH_LIMIT):
+        self.max_age = max_age
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._all = None
+        self._built_at = 0
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+
+    def _build(self, version):
+        keys, items = [], []
+        ingredients = Ingredient.objects.order_by('name', 'pk')
+        for ingredient in ingredients.iterator():
+            keys.append(ingredient.name.lower())
+            items.append(json.dumps(
+                IngredientSerializer(ingredient).data,
+                ensure_ascii=False
+            ).encode())
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in order]
+        self._items = [items[i] for i in order]
+        self._all = b'[' + b','.join(items) + b']'
+        self._built_at = time.monotonic()
+        self._version = version
+
+    def _ensure_built(self):
+        # Read before building, so a bump during the build is not missed.
+        version = get_cache_version('ingredients')
+        with self._lock:
+            if (self._keys is None or self._version != version
+                    or time.monotonic() - self._built_at > self.max_age):
+                self._build(version)
+            return self._keys, self._items, self._all
+
+    def search(self, name=None):
+        """Returns JSON bytes with ingredients matching ``name``.
+
+        Matches are ranked exact first, then by prefix, then by substring,
+        and capped at ``limit``. Without ``name`` the whole catalog is
+        returned.
+        """
+        keys, items, everything = self._ensure_built()
+
+        if not name:
+            return everything
+
+        name = name.lower()
+        start = bisect_left(keys, name)
+        end = bisect_left(keys, name + '\uffff', lo=start)
+        found = list(range(start, min(end, start + self.limit)))
+
+        if len(found) < self.limit:
+            for position, key in enumerate(keys):
+                if name in key and not key.startswith(name):
+                    found.append(position)
+                    if len(found) == self.limit:
+                        break
+
+        return b'[' + b','.join(items[position] for position in found) + b']'
+
+
+ingredient_index = IngredientIndex()
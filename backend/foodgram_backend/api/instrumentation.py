@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+from common.constants import (INSTRUMENTATION_CONFIG_REFRESH,
+                              INSTRUMENTATION_DUPLICATE_QUERIES,
+                              INSTRUMENTATION_MAX_QUERIES,
+                              INSTRUMENTATION_SLOW_REQUEST_MS,
+                              INSTRUMENTATION_SLOWEST_STATEMENTS)
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEY = 'instrumentation-config'
+
+# Metrics of the request being handled, for code without the request.
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def get_default_config():
+    return {
+        'enabled': settings.INSTRUMENTATION_ENABLED,
+        'server_timing': True,
+        'slow_request_ms': INSTRUMENTATION_SLOW_REQUEST_MS,
+        'max_queries': INSTRUMENTATION_MAX_QUERIES,
+        'duplicate_queries': INSTRUMENTATION_DUPLICATE_QUERIES,
+        'profile_sample_rate': settings.PROFILING_SAMPLE_RATE,
+    }
+
+
+class Config:
+    """Instrumentation settings, changeable at runtime in all processes.
+
+    The overrides of the defaults are kept in the JSON file ``path`` or,
+    without one, in the cache, which then has to be shared by the
+    processes. Every process re-reads them at most every ``refresh``
+    seconds, so toggling does not cost a read per request.
+    """
+
+    def __init__(self, path=None, refresh=INSTRUMENTATION_CONFIG_REFRESH):
+        self.path = path
+        self.refresh = refresh
+        self._values = None
+        self._loaded_at = 0
+
+    @property
+    def is_shared(self):
+        return self.path is not None or not isinstance(
+            caches['default'], (LocMemCache, DummyCache))
+
+    def get(self):
+        if (self._values is None
+                or time.monotonic() - self._loaded_at > self.refresh):
+            self._values = {**get_default_config(), **self.read()}
+            self._loaded_at = time.monotonic()
+        return self._values
+
+    def read(self):
+        if self.path is None:
+            return cache.get(CONFIG_KEY, {})
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.exception('Cannot read %s', self.path)
+            return {}
+
+    def write(self, overrides):
+        if self.path is None:
+            cache.set(CONFIG_KEY, overrides, None)
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(overrides, file)
+        os.replace(temp_path, self.path)
+
+    def update(self, **changes):
+        self.write({**self.read(), **changes})
+        self._values = None
+
+    def reset(self):
+        if self.path is None:
+            cache.delete(CONFIG_KEY)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self._values = None
+
+
+config = Config(settings.INSTRUMENTATION_CONFIG_FILE)
+
+
+class RequestMetrics:
+    """Timings and SQL statements of a single request.
+
+    Installed as a database execute wrapper while the request is handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_finished = None
+        self.finished = None
+        self.serialize_time = 0
+        self.serializing = False
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def total_time(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def view_time(self):
+        """Time in the view, without serialization."""
+        return ((self.view_finished or self.finished) - self.started
+                - self.serialize_time)
+
+    @property
+    def render_time(self):
+        if self.view_finished is None:
+            return 0
+        return self.finished - self.view_finished
+
+    def get_duplicates(self, threshold=1):
+        """Statements run more than ``threshold`` times, N+1s typically.
+
+        Statements are compared without parameters.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items()
+                if count > threshold}
+
+    def get_slowest(self, count=INSTRUMENTATION_SLOWEST_STATEMENTS):
+        return sorted(self.queries, key=lambda query: query[1],
+                      reverse=True)[:count]
+
+    def server_timing(self, duplicates):
+        description = f'{len(self.queries)} queries'
+        if duplicates:
+            description += f', {len(duplicates)} repeated'
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};desc="{description}"',
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+
+class TimedSerializerMixin:
+    """Counts the time a serializer spends representing objects as the
+    serialize time of the request, not as view time."""
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializing = False
+            metrics.serialize_time += time.perf_counter() - started
+
+
+class InstrumentationMiddleware:
+    """Measures requests while enabled in ``config``.
+
+    Adds a Server-Timing header, where db time overlaps view and serialize
+    time, and logs slow requests, requests with
+    too many queries and repeated statements. The metrics are available
+    to other middleware as ``request.metrics``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = config.get()
+        if not options['enabled']:
+            return self.get_response(request)
+
+        request.metrics = metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.finished = time.perf_counter()
+
+        duplicates = metrics.get_duplicates(options['duplicate_queries'])
+        if options['server_timing']:
+            response['Server-Timing'] = metrics.server_timing(duplicates)
+        self.log(request, response, metrics, duplicates, options)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called after the view, right before the response is rendered.
+        if hasattr(request, 'metrics'):
+            request.metrics.view_finished = time.perf_counter()
+        return response
+
+    def log(self, request, response, metrics, duplicates, options):
+        total_ms = metrics.total_time * 1000
+        if not (total_ms > options['slow_request_ms']
+                or len(metrics.queries) > options['max_queries']
+                or duplicates):
+            return
+
+        lines = [
+            f'{request.method} {request.get_full_path()} '
+            f'{response.status_code}: {total_ms:.1f} ms, '
+            f'{len(metrics.queries)} queries in '
+            f'{metrics.sql_time * 1000:.1f} ms'
+        ]
+        lines += [f'  {duration * 1000:.1f} ms: {sql}'
+                  for sql, duration in metrics.get_slowest()]
+        lines += [f'  repeated {count} times: {sql}'
+                  for sql, count in duplicates.items()]
+        logger.warning('\n'.join(lines))
@@ -0,0 +1,145 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.http import urlencode
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.query_budget import clear_caches
+from common.help_functions import percentile
+from recipe.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Measure latency and query counts of the main API endpoints '
+            'through the test client')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--user', type=str,
+                            help='email of the user to authenticate as, '
+                                 'the one with the largest cart by default')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='clear the shared and process caches '
+                                 'before every request')
+        parser.add_argument('--scenario', action='append', default=[],
+                            help='run only scenarios with these names')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+
+        anonymous = APIClient()
+        authenticated = APIClient()
+        authenticated.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        scenarios = [
+            (name, client, urls) for name, client, urls
+            in self.get_scenarios(anonymous, authenticated)
+            if urls and (not options['scenario']
+                         or name in options['scenario'])
+        ]
+
+        self.stdout.write(
+            f'{"scenario":<32}{"p50 ms":>9}{"p95 ms":>9}'
+            f'{"queries":>9}{"errors":>8}')
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name, client, urls in scenarios:
+                self.run_scenario(name, client, urls, options)
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                cart_size=Count('shoppingcartitem')
+            ).order_by('-cart_size', 'pk').first()
+        if user is None:
+            raise CommandError('No user to run the benchmark as, '
+                               'see the generate_data command')
+        return user
+
+    def get_scenarios(self, anonymous, authenticated):
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:1000])
+        if not recipe_ids:
+            raise CommandError('There are no recipes, '
+                               'see the generate_data command')
+
+        author_id = Recipe.objects.values('author').annotate(
+            recipes=Count('pk')).order_by('-recipes')[0]['author']
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        words = [word for name in Recipe.objects.values_list(
+            'name', flat=True)[:100] for word in name.split()]
+        names = list(Ingredient.objects.values_list('name', flat=True)[:1000])
+
+        last_page = max(
+            len(recipe_ids) // settings.REST_FRAMEWORK['PAGE_SIZE'], 1)
+
+        recipes = '/api/recipes/'
+        details = [f'{recipes}{pk}/' for pk in self.random.sample(
+            recipe_ids, min(len(recipe_ids), 100))]
+        return [
+            ('recipes', anonymous, [recipes]),
+            ('recipes, authenticated', authenticated, [recipes]),
+            ('recipes, deep page', authenticated,
+             [f'{recipes}?page={min(last_page, 10)}']),
+            ('recipes, cursor', authenticated, [f'{recipes}?cursor=']),
+            ('recipes, author', authenticated,
+             [f'{recipes}?author={author_id}']),
+            ('recipes, tags', authenticated,
+             [f'{recipes}?tags={slug}' for slug in tags]),
+            ('recipes, favorited', authenticated,
+             [f'{recipes}?is_favorited=1']),
+            ('recipes, in cart', authenticated,
+             [f'{recipes}?is_in_shopping_cart=1']),
+            ('recipes, search', authenticated,
+             [f'{recipes}?{urlencode({"search": word})}' for word in words]),
+            ('recipe detail', anonymous, details),
+            ('recipe detail, authenticated', authenticated, details),
+            ('subscriptions', authenticated,
+             ['/api/users/subscriptions/?recipes_limit=3']),
+            ('shopping cart download', authenticated,
+             [f'{recipes}download_shopping_cart/']),
+            ('ingredient search', anonymous,
+             [f'/api/ingredients/?{urlencode({"name": name[:3]})}'
+              for name in names]),
+            ('tags', anonymous, ['/api/tags/']),
+        ]
+
+    def run_scenario(self, name, client, urls, options):
+        for _ in range(options['warmup']):
+            client.get(self.random.choice(urls))
+
+        timings, queries, errors = [], [], 0
+        for _ in range(options['requests']):
+            url = self.random.choice(urls)
+            if options['no_cache']:
+                clear_caches()
+
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+            errors += response.status_code >= 400
+
+        self.stdout.write(
+            f'{name:<32}{statistics.median(timings):>9.1f}'
+            f'{percentile(timings, 95):>9.1f}'
+            f'{statistics.mean(queries):>9.1f}{errors:>8}')
@@ -0,0 +1,60 @@
+import base64
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+from rest_framework import serializers
+
+from api.fields import Base64ImageField
+
+
+def decode_whole(data):
+    """Decoding as done before: the whole payload at once."""
+    format, imgstr = data.split(';base64,')
+    ext = format.split('/')[-1]
+    content = ContentFile(base64.b64decode(imgstr), name=f'image.{ext}')
+    return serializers.ImageField().to_internal_value(content)
+
+
+class Command(BaseCommand):
+    help = 'Compare peak memory of whole and chunked base64 image decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, default=8,
+                            help='approximate image size in megabytes')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        data = self.make_payload(options['size'])
+        self.stdout.write(f'payload: {len(data) / 2 ** 20:.1f} MB of base64')
+
+        for title, decode in (
+                ('whole', decode_whole),
+                ('chunked', Base64ImageField().to_internal_value)):
+            peaks, timings = [], []
+            for _ in range(options['repeat']):
+                tracemalloc.start()
+                started = time.perf_counter()
+                upload = decode(data)
+                timings.append((time.perf_counter() - started) * 1000)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                upload.close()
+
+            self.stdout.write(
+                f'{title}: peak {max(peaks) / 2 ** 20:.1f} MB, '
+                f'best {min(timings):.1f} ms')
+
+    def make_payload(self, size):
+        # Noise does not compress, so the PNG is about as large as raw RGB.
+        side = int((size * 2 ** 20 / 3) ** 0.5)
+        image = Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3))
+        buffer = BytesIO()
+        image.save(buffer, 'PNG', compress_level=1)
+        return ('data:image/png;base64,'
+                + base64.b64encode(buffer.getvalue()).decode())
@@ -0,0 +1,51 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.filters import IngredientFilter
+from api.ingredient_index import ingredient_index
+from api.serializers import IngredientSerializer
+from common.help_functions import percentile
+from recipe.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient autocomplete through the DB and the index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefixes', nargs='*', type=str,
+                            help='search strings, sampled from names if empty')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        prefixes = options['prefixes'] or self.sample_prefixes()
+        repeat = options['repeat']
+
+        ingredient_index.invalidate()
+        ingredient_index.search()
+
+        for title, search in (('database', self.search_database),
+                              ('index', ingredient_index.search)):
+            timings = []
+            for _ in range(repeat):
+                for prefix in prefixes:
+                    started = time.perf_counter()
+                    search(prefix)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(
+                f'{title}: {len(timings)} queries, '
+                f'mean {statistics.mean(timings):.3f} ms, '
+                f'p95 {percentile(timings, 95):.3f} ms')
+
+    def search_database(self, name):
+        queryset = IngredientFilter(
+            {'name': name}, queryset=Ingredient.objects.all()).qs
+        return JSONRenderer().render(
+            IngredientSerializer(queryset, many=True).data)
+
+    def sample_prefixes(self):
+        names = Ingredient.objects.values_list('name', flat=True)[:200:20]
+        return [name[:length] for name in names for length in (1, 2, 4)]
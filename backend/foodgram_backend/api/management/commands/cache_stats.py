@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.caching import get_cache_stats
+from api.metrics import registry
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts of the response caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespaces', nargs='*', type=str,
+                            default=['recipes', 'tags', 'ingredients'])
+
+    def handle(self, *args, **options):
+        if registry.directory is None:
+            raise CommandError(
+                'METRICS_DIR is not set: the server processes keep their '
+                'stats to themselves')
+        for namespace in options['namespaces']:
+            hits, misses = get_cache_stats(namespace)
+            total = hits + misses
+            ratio = hits / total if total else 0
+            self.stdout.write(
+                f'{namespace}: {hits} hits, {misses} misses, '
+                f'hit ratio {ratio:.2%}')
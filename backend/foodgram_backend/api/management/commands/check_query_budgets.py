@@ -0,0 +1,100 @@
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+
+from api.query_budget import (QUERY_BUDGETS, QueryBudgetData,
+                              QueryBudgetExceeded, clear_caches, query_budget,
+                              request_route)
+from common.images import executor
+
+
+class Command(BaseCommand):
+    help = ('Run the API routes against seeded data of two sizes in a test '
+            'database and fail if their queries exceed the budgets in '
+            'api.query_budget or grow with the data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs=2, default=(30, 150),
+                            metavar=('SMALL', 'LARGE'),
+                            help='recipes in the database for both runs')
+        parser.add_argument('--route', action='append', default=[],
+                            help='check only routes with these names')
+        parser.add_argument('--verbose-queries', action='store_true',
+                            help='print the queries of routes over budget')
+
+    def handle(self, *args, **options):
+        small, large = options['sizes']
+        if not 0 < small < large:
+            raise CommandError('The sizes must grow')
+        routes = [route for route in QUERY_BUDGETS
+                  if not options['route'] or route[0] in options['route']]
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        MEDIA_ROOT=media_root,
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                data = QueryBudgetData()
+                results = [self.run_routes(data, routes, size, options)
+                           for size in (small, large)]
+                # Renditions of uploaded images are written in the
+                # background; they must be done before the media go.
+                executor.shutdown(wait=True)
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        self.report(routes, *results)
+
+    def run_routes(self, data, routes, size, options):
+        try:
+            objects = data.seed(size)
+        except RuntimeError as error:
+            raise CommandError(error)
+        results = {}
+        for name, budget, client, method, url, request_data in routes:
+            # Every route is measured without cached responses and users.
+            clear_caches()
+            try:
+                with query_budget(budget) as queries:
+                    response = request_route(
+                        data.clients, objects, client, method, url,
+                        request_data)
+                error = None
+            except QueryBudgetExceeded as exceeded:
+                error = exceeded
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{name}: {method.upper()} {url.format(**objects)} '
+                    f'responded {response.status_code}')
+            if error and options['verbose_queries']:
+                self.stderr.write(f'{name}, {size} recipes: {error}')
+            results[name] = len(queries)
+        return results
+
+    def report(self, routes, small, large):
+        self.stdout.write(
+            f'{"route":<32}{"budget":>8}{"small":>8}{"large":>8}  result')
+        failures = 0
+        for name, budget, *_ in routes:
+            if max(small[name], large[name]) > budget:
+                result = 'over budget'
+            elif large[name] > small[name]:
+                result = 'grows with data'
+            else:
+                result = 'ok'
+            failures += result != 'ok'
+            style = self.style.SUCCESS if result == 'ok' else self.style.ERROR
+            self.stdout.write(f'{name:<32}{budget:>8}{small[name]:>8}'
+                              f'{large[name]:>8}  {style(result)}')
+
+        if failures:
+            raise CommandError(f'{failures} routes failed their query budget')
+        self.stdout.write(self.style.SUCCESS(
+            f'All {len(routes)} routes within their query budget'))
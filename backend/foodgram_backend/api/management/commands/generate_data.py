@@ -0,0 +1,237 @@
+import random
+import time
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from api.caching import bump_cache_version
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           RecipeShortURL, ShoppingCartItem, ShoppingListItem,
+                           Tag)
+from recipe.search import update_search_vectors
+from recipe.short_urls import get_new_hashes
+from users.models import Subscription
+
+User = get_user_model()
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'соус',
+         'домашний', 'быстрый', 'острый', 'сладкий', 'овощной', 'мясной',
+         'рыбный', 'летний', 'зимний', 'с грибами', 'с курицей', 'с сыром')
+
+
+def power_law_weights(count, exponent):
+    """Cumulative Zipf weights: the item of rank r gets 1 / r^exponent."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic users, subscriptions, recipes, favorites '
+            'and shopping carts for load testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='minimum number of ingredients')
+        parser.add_argument('--tags', type=int, default=6,
+                            help='minimum number of tags')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--subscriptions', type=int, default=20,
+                            help='mean subscriptions per user')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='mean favorites per user')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='mean shopping cart recipes per user')
+        parser.add_argument('--exponent', type=float, default=1.2,
+                            help='power-law exponent of author popularity')
+        parser.add_argument('--days', type=int, default=365,
+                            help='spread of publication dates')
+        parser.add_argument('--prefix', type=str, default='synthetic',
+                            help='prefix of generated usernames and emails')
+        parser.add_argument('--password', type=str, default='synthetic')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+
+        with transaction.atomic():
+            ingredient_ids = self.step('ingredients', self.create_ingredients)
+            tag_ids = self.step('tags', self.create_tags)
+            user_ids = self.step('users', self.create_users)
+            # The same users are popular as authors and as creators.
+            self.random.shuffle(user_ids)
+            popularity = power_law_weights(
+                len(user_ids), options['exponent'])
+            self.step('subscriptions', self.create_subscriptions,
+                      user_ids, popularity)
+            recipe_ids = self.step('recipes', self.create_recipes,
+                                   user_ids, popularity)
+            self.step('recipe ingredients and tags', self.create_relations,
+                      recipe_ids, ingredient_ids, tag_ids)
+            self.step('favorites and carts', self.create_user_sets,
+                      user_ids, recipe_ids)
+            self.step('shopping lists', ShoppingListItem.objects.rebuild,
+                      user_ids)
+            self.step('short links', self.create_short_links, recipe_ids)
+            self.step('search vectors', update_search_vectors, recipe_ids)
+
+        for namespace in ('ingredients', 'tags', 'recipes', 'counts'):
+            bump_cache_version(namespace)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(user_ids)} users and {len(recipe_ids)} recipes'))
+
+    def step(self, title, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} s')
+        return result
+
+    def insert(self, model, objects):
+        """Bulk inserts objects, returning their ids in insertion order."""
+        if connection.features.can_return_rows_from_bulk_insert:
+            return [obj.pk for obj in model.objects.bulk_create(
+                objects, batch_size=self.batch_size)]
+
+        # Without RETURNING, new rows are the ones above the old maximum;
+        # the data is generated in a single transaction.
+        last_pk = model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def create_ingredients(self):
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'ингредиент {number}',
+                        measurement_unit=self.random.choice(UNITS))
+             for number in range(existing, self.options['ingredients'])),
+            batch_size=self.batch_size, ignore_conflicts=True)
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def create_tags(self):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            (Tag(name=f'Тег {number}', slug=f'tag-{number}')
+             for number in range(existing, self.options['tags'])),
+            ignore_conflicts=True)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        offset = User.objects.filter(username__startswith=prefix).count()
+        # Hashing is slow by design; every user gets the same hash.
+        password = make_password(self.options['password'])
+        return self.insert(User, [
+            User(username=f'{prefix}{number}',
+                 email=f'{prefix}{number}@example.com',
+                 first_name='Имя', last_name=f'Фамилия {number}',
+                 password=password)
+            for number in range(offset, offset + self.options['users'])
+        ])
+
+    def sample_count(self, mean):
+        if not mean:
+            return 0
+        return min(int(self.random.expovariate(1 / mean)), 10 * mean)
+
+    def create_subscriptions(self, user_ids, popularity):
+        subscriptions = []
+        for subscriber_id in user_ids:
+            creator_ids = set(self.random.choices(
+                user_ids, cum_weights=popularity,
+                k=self.sample_count(self.options['subscriptions'])))
+            creator_ids.discard(subscriber_id)
+            subscriptions += [
+                Subscription(subscriber_id=subscriber_id,
+                             creator_id=creator_id)
+                for creator_id in creator_ids
+            ]
+        Subscription.objects.bulk_create(
+            subscriptions, batch_size=self.batch_size)
+
+    def create_recipes(self, user_ids, popularity):
+        image = self.create_image()
+        now = timezone.now()
+        count = self.options['recipes']
+        recipes = [
+            Recipe(name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                   text=' '.join(self.random.choices(WORDS, k=40)),
+                   cooking_time=self.random.randint(5, 180),
+                   author_id=author_id,
+                   image=image)
+            for author_id in self.random.choices(
+                user_ids, cum_weights=popularity, k=count)
+        ]
+        recipe_ids = self.insert(Recipe, recipes)
+
+        # pub_date is auto_now_add, so dates are spread after the insert.
+        seconds = self.options['days'] * 24 * 60 * 60
+        Recipe.objects.bulk_update(
+            [Recipe(pk=recipe_id, pub_date=now - timedelta(
+                seconds=self.random.randint(0, seconds)))
+             for recipe_id in recipe_ids],
+            ['pub_date'], batch_size=self.batch_size)
+        return recipe_ids
+
+    def create_image(self):
+        image = Image.new('RGB', (640, 480), (200, 120, 60))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG')
+        return default_storage.save(
+            'recipes/images/synthetic.jpg', ContentFile(buffer.getvalue()))
+
+    def create_relations(self, recipe_ids, ingredient_ids, tag_ids):
+        per_recipe = min(self.options['ingredients_per_recipe'],
+                         len(ingredient_ids))
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                              amount=self.random.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in self.random.sample(
+                 ingredient_ids, self.random.randint(1, per_recipe))),
+            batch_size=self.batch_size)
+
+        RecipeTag = Recipe.tags.through
+        RecipeTag.objects.bulk_create(
+            (RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in self.random.sample(
+                 tag_ids, self.random.randint(1, min(3, len(tag_ids))))),
+            batch_size=self.batch_size)
+
+    def create_user_sets(self, user_ids, recipe_ids):
+        # Recipes are popular by a power law as well.
+        popularity = power_law_weights(
+            len(recipe_ids), self.options['exponent'])
+        for model, mean in ((Favorite, self.options['favorites']),
+                            (ShoppingCartItem, self.options['cart'])):
+            model.objects.bulk_create(
+                (model(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in user_ids
+                 for recipe_id in set(self.random.choices(
+                     recipe_ids, cum_weights=popularity,
+                     k=self.sample_count(mean)))),
+                batch_size=self.batch_size)
+
+    def create_short_links(self, recipe_ids):
+        for start in range(0, len(recipe_ids), self.batch_size):
+            hashes = get_new_hashes(recipe_ids[start:start + self.batch_size])
+            RecipeShortURL.objects.bulk_create(
+                RecipeShortURL(recipe_id=recipe_id, hash=hash)
+                for recipe_id, hash in hashes.items())
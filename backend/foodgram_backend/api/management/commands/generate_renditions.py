@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.caching import bump_cache_version
+from common.images import generate_renditions
+from recipe.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Generate missing renditions of recipe images and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate existing renditions too')
+
+    def handle(self, *args, **options):
+        names = list(
+            Recipe.objects.exclude(image='').values_list('image', flat=True))
+        names += User.objects.exclude(avatar='').values_list(
+            'avatar', flat=True)
+
+        generated = failed = 0
+        for name in names:
+            try:
+                generated += generate_renditions(name, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+
+        if generated:
+            bump_cache_version('recipes')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {generated} of {len(names)} images, '
+            f'{failed} failed'))
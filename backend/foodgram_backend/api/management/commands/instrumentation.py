@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.instrumentation import config
+
+
+class Command(BaseCommand):
+    help = ('Switch request instrumentation on or off and change its '
+            'options in all processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('state',
+                            choices=('on', 'off', 'set', 'reset', 'status'),
+                            help='"set" only changes the given options')
+        parser.add_argument('--server-timing', choices=('on', 'off'))
+        parser.add_argument('--slow-request-ms', type=int)
+        parser.add_argument('--max-queries', type=int)
+        parser.add_argument('--duplicate-queries', type=int)
+        parser.add_argument('--profile-sample-rate', type=float,
+                            help='share of requests to profile, 0 to 1')
+
+    def handle(self, *args, **options):
+        state = options['state']
+        if state != 'status' and not config.is_shared:
+            raise CommandError(
+                'Changes would not reach the server processes: set '
+                'INSTRUMENTATION_CONFIG_FILE or a shared CACHE_BACKEND')
+        rate = options['profile_sample_rate']
+        if rate is not None and not 0 <= rate <= 1:
+            raise CommandError('--profile-sample-rate must be from 0 to 1')
+
+        if state == 'reset':
+            config.reset()
+        elif state != 'status':
+            changes = {}
+            if state != 'set':
+                changes['enabled'] = state == 'on'
+            if options['server_timing']:
+                changes['server_timing'] = options['server_timing'] == 'on'
+            for option in ('slow_request_ms', 'max_queries',
+                           'duplicate_queries', 'profile_sample_rate'):
+                if options[option] is not None:
+                    changes[option] = options[option]
+            config.update(**changes)
+
+        for name, value in config.get().items():
+            self.stdout.write(f'{name}: {value}')
+        if state != 'status':
+            self.stdout.write(self.style.SUCCESS(
+                f'Applied within {config.refresh} s in every process'))
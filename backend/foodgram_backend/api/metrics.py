@@ -0,0 +1,284 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from common.constants import (METRICS_FLUSH_INTERVAL, METRICS_LATENCY_BUCKETS,
+                              METRICS_QUERY_BUCKETS, METRICS_SIZE_BUCKETS)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+COUNTERS = {
+    'foodgram_requests_total': 'Requests by view, action and status.',
+    'foodgram_cache_requests_total': 'Response cache lookups by result.',
+}
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Request latency.', METRICS_LATENCY_BUCKETS),
+    'foodgram_request_db_queries': (
+        'Database queries per request.', METRICS_QUERY_BUCKETS),
+    'foodgram_response_size_bytes': (
+        'Size of non-streaming responses.', METRICS_SIZE_BUCKETS),
+}
+
+
+class MetricsRegistry:
+    """Counters and histograms of this process.
+
+    With ``directory`` set, every process regularly writes its values to
+    a file of its own there, and ``collect`` sums the files of all
+    processes, so gunicorn workers can share one endpoint. The hooks in
+    gunicorn.conf.py clear the directory on start and fold the files of
+    exited workers.
+    """
+
+    def __init__(self, directory=None, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, tuple(labels))
+        with self._lock:
+            # Per-bucket counts with +Inf last, then the sum.
+            values = self._histograms.setdefault(
+                key, [0] * (len(buckets) + 2))
+            index = next((index for index, bound in enumerate(buckets)
+                          if value <= bound), len(buckets))
+            values[index] += 1
+            values[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self._counters.items()],
+                'histograms': [[name, labels, list(values)]
+                               for (name, labels), values
+                               in self._histograms.items()],
+            }
+
+    def get_path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self, force=False):
+        if self.directory is None or not force and (
+                time.monotonic() - self._flushed_at < self.flush_interval):
+            return
+        self._flushed_at = time.monotonic()
+
+        os.makedirs(self.directory, exist_ok=True)
+        write_snapshot(self.get_path(os.getpid()), self.snapshot())
+
+    def collect(self):
+        """Returns counters and histograms summed over all processes."""
+        if self.directory is None:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(force=True)
+            snapshots = []
+            for path in glob.glob(
+                    os.path.join(self.directory, 'metrics-*.json')):
+                try:
+                    snapshots.append(read_snapshot(path))
+                except FileNotFoundError:
+                    # Folded by mark_process_dead meanwhile.
+                    continue
+        return merge_snapshots(snapshots)
+
+    def mark_process_dead(self, pid):
+        """Folds the metrics of a finished process into the file of all
+        finished processes, so files of old workers do not pile up and
+        the totals do not drop. Called by the server's master process.
+        """
+        if self.directory is None:
+            return
+        path = self.get_path(pid)
+        try:
+            snapshot = read_snapshot(path)
+        except FileNotFoundError:
+            return
+
+        dead_path = self.get_path('dead')
+        snapshots = [snapshot]
+        if os.path.exists(dead_path):
+            snapshots.append(read_snapshot(dead_path))
+        counters, histograms = merge_snapshots(snapshots)
+        write_snapshot(dead_path, {
+            'counters': [[name, labels, value]
+                         for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, values]
+                           for (name, labels), values in histograms.items()],
+        })
+        os.remove(path)
+
+    def clear(self):
+        """Removes the files of all processes, when the server starts."""
+        if self.directory is None:
+            return
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*')):
+            os.remove(path)
+
+
+def read_snapshot(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_snapshot(path, snapshot):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(temp_path, path)
+
+
+def merge_snapshots(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    labels = (*labels, *extra.items())
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels)
+    return f'{{{pairs}}}'
+
+
+def render_metrics(counters, histograms):
+    lines = []
+    for name, description in COUNTERS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        lines += [f'{name}{format_labels(labels)} {value}'
+                  for (series, labels), value in sorted(counters.items())
+                  if series == name]
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{name}_bucket'
+                             f'{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {values[-1]}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+
+    name = 'foodgram_cache_hit_ratio'
+    lines += [f'# HELP {name} Share of response cache lookups that hit.',
+              f'# TYPE {name} gauge']
+    results = {}
+    for (series, labels), value in counters.items():
+        if series == 'foodgram_cache_requests_total':
+            labels = dict(labels)
+            results.setdefault(labels['namespace'], {})[
+                labels['result']] = value
+    for namespace, counts in sorted(results.items()):
+        total = counts.get('hit', 0) + counts.get('miss', 0)
+        lines.append(f'{name}{format_labels((("namespace", namespace),))} '
+                     f'{counts.get("hit", 0) / total if total else 0}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(settings.METRICS_DIR)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def get_view_labels(view_func, method):
+    """(view, action) of a view; viewset views are named by class."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}', ''
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method.lower(), method.lower())
+
+
+class MetricsMiddleware:
+    """Records latency, query count and size of every response."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        # Unresolved paths share one label, so scans cannot blow up the
+        # number of series.
+        view, action = getattr(
+            request, 'metrics_view', ('unresolved', ''))
+        labels = (('view', view), ('action', action),
+                  ('method', request.method))
+        registry.inc('foodgram_requests_total',
+                     (*labels, ('status', str(response.status_code))))
+        registry.observe('foodgram_request_duration_seconds', labels,
+                         duration)
+        registry.observe('foodgram_request_db_queries', labels,
+                         queries.count)
+        if not response.streaming:
+            registry.observe('foodgram_response_size_bytes', labels,
+                             len(response.content))
+        registry.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_labels(view_func, request.method)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of the metrics of all processes.
+
+    Available to staff users and, if METRICS_TOKEN is set, to requests
+    with ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or token and constant_time_compare(
+            authorization, f'Bearer {token}')):
+        return HttpResponse(status=403)
+
+    return HttpResponse(render_metrics(*registry.collect()),
+                        content_type=CONTENT_TYPE)
@@ -1,5 +1,215 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from common.constants import COUNT_CACHE_TIMEOUT, COUNT_ESTIMATE_THRESHOLD
+
+from .caching import get_cache_version
+
+
+def get_user_counts_namespace(user_id):
+    return f'counts:user:{user_id}'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator caching counts by the SQL of the paginated queryset.
+
+    Counts are cached under the versions of ``namespaces``: 'counts' for
+    changes any list may show, and the namespace of the requesting user
+    for changes only lists filtered by that user's rows may show (see
+    ``api.signals``).
+
+    On PostgreSQL, result sets the planner estimates above
+    ``estimate_threshold`` rows are counted from that estimate instead of
+    a COUNT(*), and ``is_approximate`` is set.
+    """
+    cache_timeout = COUNT_CACHE_TIMEOUT
+    estimate_threshold = COUNT_ESTIMATE_THRESHOLD
+    is_approximate = False
+
+    def __init__(self, *args, namespaces=('counts',), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namespaces = namespaces
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        signature = md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+        version = '.'.join(str(get_cache_version(namespace))
+                           for namespace in self.namespaces)
+        key = f'pagination-count:{version}:{signature}'
+
+        cached = cache.get(key)
+        if cached is None:
+            cached = self.calculate_count(queryset, sql, params)
+            cache.set(key, cached, self.cache_timeout)
+
+        count, self.is_approximate = cached
+        return count
+
+    def calculate_count(self, queryset, sql, params):
+        connection = connections[queryset.db]
+
+        if (connection.vendor == 'postgresql'
+                and self.estimate_threshold is not None):
+            estimate = self.estimate_count(connection, sql, params)
+            if estimate >= self.estimate_threshold:
+                return estimate, True
+
+        return queryset.count(), False
+
+    def estimate_count(self, connection, sql, params):
+        # For unfiltered querysets the planner takes this straight from
+        # pg_class.reltuples; filters apply its selectivity estimates.
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class CachedCountPagination(PageLimitPagination):
+    """Page/limit pagination with cached and, if large, estimated counts."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_namespaces = ('counts',)
+        if request.user.is_authenticated:
+            self.count_namespaces += (
+                get_user_counts_namespace(request.user.pk),)
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, queryset, page_size):
+        return CachedCountPaginator(
+            queryset, page_size, namespaces=self.count_namespaces)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.page.paginator.is_approximate:
+            response.data['count_is_approximate'] = True
+        return response
+
+
+class PageLimitKeysetPagination(CachedCountPagination):
+    """Page/limit pagination with an opt-in keyset (cursor) mode.
+
+    Passing ``?cursor=`` (empty for the first page) switches to pages
+    keyed on (``position_field``, pk) in descending order: a page is
+    fetched with a range condition instead of OFFSET, and no COUNT is run.
+    Requests without ``cursor`` keep the page/limit contract.
+    """
+    cursor_query_param = 'cursor'
+    position_field = 'pub_date'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, pk, reverse = self.decode_cursor(request)
+
+        field = self.position_field
+        if reverse:
+            queryset = queryset.order_by(field, 'pk')
+            lookup = 'gt'
+        else:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+            lookup = 'lt'
+
+        if position is not None:
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': position})
+                | Q(**{field: position, f'pk__{lookup}': pk})
+            )
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first = results[0] if results else None
+        self.last = results[-1] if results else None
+
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_cursor_link(self.last, self.has_next)),
+            ('previous', self.get_cursor_link(
+                self.first, self.has_previous, reverse=True)),
+            ('results', data),
+        ]))
+
+    def get_cursor_link(self, instance, exists, reverse=False):
+        if not exists or instance is None:
+            return None
+
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(instance, reverse))
+
+    def encode_cursor(self, instance, reverse):
+        position = getattr(instance, self.position_field).isoformat()
+        cursor = f'{position}|{instance.pk}|{int(reverse)}'
+        return b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, None, False
+
+        try:
+            position, pk, reverse = b64decode(
+                cursor.encode()).decode().split('|')
+            position = parse_datetime(position)
+            pk = int(pk)
+            reverse = bool(int(reverse))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, pk, reverse
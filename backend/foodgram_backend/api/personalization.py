@@ -0,0 +1,59 @@
+import json
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from common.constants import USER_SETS_CACHE_TIMEOUT
+from recipe.models import Favorite, ShoppingCartItem
+from users.models import Subscription
+
+from .caching import bump_cache_version, get_cache_version
+
+# model: (field pointing to the user, field with the marked object id)
+USER_SETS = {
+    Favorite: ('user', 'recipe_id'),
+    ShoppingCartItem: ('user', 'recipe_id'),
+    Subscription: ('subscriber', 'creator_id'),
+}
+
+
+def get_user_set_namespace(user_id, model):
+    return f'user-set:{model._meta.model_name}:{user_id}'
+
+
+def get_user_set(user, model):
+    """Returns ids of recipes (or creators) the user marked with ``model``."""
+    namespace = get_user_set_namespace(user.pk, model)
+    key = f'{namespace}:{get_cache_version(namespace)}'
+    ids = cache.get(key)
+
+    if ids is None:
+        user_field, id_field = USER_SETS[model]
+        ids = set(model.objects.filter(
+            **{user_field: user}).values_list(id_field, flat=True))
+        cache.set(key, ids, USER_SETS_CACHE_TIMEOUT)
+
+    return ids
+
+
+def forget_user_set(user_id, model):
+    # A new version rather than changing the stored set, which a request
+    # reading the old rows could overwrite.
+    bump_cache_version(get_user_set_namespace(user_id, model))
+
+
+def personalize_recipes(content, user):
+    """Sets the user's flags on a rendered recipe page or recipe."""
+    data = json.loads(content)
+    favorites = get_user_set(user, Favorite)
+    shopping_cart = get_user_set(user, ShoppingCartItem)
+    subscriptions = get_user_set(user, Subscription)
+
+    recipes = data['results'] if 'results' in data else [data]
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in favorites
+        recipe['is_in_shopping_cart'] = recipe['id'] in shopping_cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in subscriptions)
+
+    return JSONRenderer().render(data)
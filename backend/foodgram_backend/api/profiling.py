@@ -0,0 +1,230 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from common.constants import (PROFILING_HEADER, PROFILING_MAX_FILES,
+                              PROFILING_TOP_FUNCTIONS)
+
+from .authentication import CachedTokenAuthentication
+from .instrumentation import config
+
+PROFILE_NAME = re.compile(r'^[\d-]+$')
+SORT_KEYS = {'cumulative': 3, 'tottime': 2, 'calls': 1}
+
+# Only one profiler can be active in a process at a time.
+profiler_lock = threading.Lock()
+
+
+def is_staff_request(request):
+    if request.user.is_staff:
+        return True
+    # API clients authenticate with tokens, which DRF only checks in
+    # the view.
+    try:
+        credentials = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return credentials is not None and credentials[0].is_staff
+
+
+def get_profile_path(name, extension):
+    if not PROFILE_NAME.match(name):
+        raise Http404
+    return os.path.join(settings.PROFILING_DIR, f'{name}.{extension}')
+
+
+def save_profile(profiler, info):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}'
+    profiler.dump_stats(get_profile_path(name, 'prof'))
+
+    # Profiles are listed by their info files, so these come last.
+    path = get_profile_path(name, 'json')
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(info, file)
+    os.replace(f'{path}.tmp', path)
+
+    for path in sorted(glob.glob(os.path.join(directory, '*.json')))[
+            :-PROFILING_MAX_FILES]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(f'{os.path.splitext(path)[0]}.{extension}')
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    profiles = []
+    for path in sorted(glob.glob(
+            os.path.join(settings.PROFILING_DIR, '*.json')), reverse=True):
+        try:
+            with open(path) as file:
+                info = json.load(file)
+        except (OSError, ValueError):
+            continue
+        info['name'] = os.path.splitext(os.path.basename(path))[0]
+        profiles.append(info)
+    return profiles
+
+
+def get_location(filename, line):
+    # Paths are shown relative to sys.path, like module paths.
+    for directory in sorted(sys.path, key=len, reverse=True):
+        if directory and filename.startswith(directory + os.sep):
+            filename = filename[len(directory) + 1:]
+            break
+    return f'{filename}:{line}' if line else filename
+
+
+def get_top_functions(stats, sort='cumulative',
+                      limit=PROFILING_TOP_FUNCTIONS):
+    rows = sorted(stats.stats.items(),
+                  key=lambda item: item[1][SORT_KEYS[sort]], reverse=True)
+    return [
+        {
+            'function': function,
+            'location': get_location(filename, line),
+            'calls': (f'{calls}/{primitive_calls}'
+                      if calls != primitive_calls else calls),
+            'tottime': own_time * 1000,
+            'cumtime': total_time * 1000,
+            'percall': total_time * 1000 / calls if calls else 0,
+        }
+        for (filename, line, function),
+            (primitive_calls, calls, own_time, total_time, _) in rows[:limit]
+    ]
+
+
+class ProfilingMiddleware:
+    """Runs requests under cProfile and stores the profiles.
+
+    A share of requests is sampled, see the ``profile_sample_rate`` of
+    the instrumentation config, and requests of staff users are
+    profiled on demand with the X-Profile header. Only the latest
+    profiles are kept, they are listed at /admin/profiles/.
+
+    It needs request.user, so it comes after AuthenticationMiddleware
+    and the middleware before it are not profiled; their time shows in
+    Server-Timing. Streamed bodies are profiled while they are sent, and
+    their duration includes waiting for the client.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = self.get_reason(request)
+        if reason is None or not profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        except BaseException:
+            profiler_lock.release()
+            raise
+
+        def finish():
+            profiler_lock.release()
+            self.save(request, response, profiler,
+                      time.perf_counter() - started, reason)
+
+        if response.streaming:
+            # Streamed bodies are produced after the view returns.
+            response.streaming_content = self.profile_stream(
+                response.streaming_content, profiler, finish)
+        else:
+            finish()
+        return response
+
+    def profile_stream(self, content, profiler, finish):
+        try:
+            chunks = iter(content)
+            while True:
+                profiler.enable()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    profiler.disable()
+                yield chunk
+        finally:
+            finish()
+
+    def save(self, request, response, profiler, duration, reason):
+        view, action = getattr(request, 'metrics_view', ('', ''))
+        save_profile(profiler, {
+            'created': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view,
+            'action': action,
+            'status': response.status_code,
+            'duration_ms': duration * 1000,
+            'reason': reason,
+        })
+
+    def get_reason(self, request):
+        if (request.headers.get(PROFILING_HEADER)
+                and is_staff_request(request)):
+            return 'header'
+        sample_rate = config.get()['profile_sample_rate']
+        if sample_rate and random.random() < sample_rate:
+            return 'sampled'
+        return None
+
+
+def get_admin_context(request, **context):
+    return {**admin.site.each_context(request), **context}
+
+
+def profile_list_view(request):
+    return render(request, 'api/profiles.html', get_admin_context(
+        request, title='Профили запросов', profiles=list_profiles()))
+
+
+def profile_detail_view(request, name):
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        sort = 'cumulative'
+    try:
+        with open(get_profile_path(name, 'json')) as file:
+            info = json.load(file)
+        stats = pstats.Stats(get_profile_path(name, 'prof'))
+    except FileNotFoundError:
+        raise Http404
+    return render(request, 'api/profile.html', get_admin_context(
+        request, title=f'{info["method"]} {info["path"]}', name=name,
+        info=info, sort=sort, sort_keys=SORT_KEYS,
+        total_calls=stats.total_calls,
+        total_time=stats.total_tt * 1000,
+        functions=get_top_functions(stats, sort)))
+
+
+def profile_download_view(request, name):
+    try:
+        return FileResponse(open(get_profile_path(name, 'prof'), 'rb'),
+                            as_attachment=True, filename=f'{name}.prof')
+    except FileNotFoundError:
+        raise Http404
@@ -0,0 +1,248 @@
+import base64
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipe import short_urls
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeShortURL,
+                           ShoppingCartItem, ShoppingListItem, Tag)
+from recipe.search import recipe_search_index
+from users.models import Subscription
+
+from . import authentication
+from .ingredient_index import ingredient_index
+
+User = get_user_model()
+
+# Declared query budgets of the API routes, checked against seeded data
+# of two sizes by QueryBudgetTests and the check_query_budgets command,
+# which also fail if the queries grow with the data. URLs and request data
+# are filled in from the seeded objects: {recipe} and {spare_recipe} are
+# recipes of the user, {other_recipe} and {author} are neither in the
+# user's lists nor subscribed to. Writes send recipes with five
+# ingredients, their queries grow with the ingredients of the request.
+# Routes are measured with the caches of the process cleared as well,
+# so the queries of authenticated routes include the token lookup.
+# (name, budget, client, method, url, data)
+QUERY_BUDGETS = (
+    ('recipes', 4, 'anonymous', 'get', '/api/recipes/', None),
+    ('recipes, authenticated', 8, 'user', 'get', '/api/recipes/', None),
+    ('recipes, favorited', 6, 'user', 'get',
+     '/api/recipes/?is_favorited=1', None),
+    ('recipes, in cart', 6, 'user', 'get',
+     '/api/recipes/?is_in_shopping_cart=1', None),
+    ('recipe detail', 3, 'anonymous', 'get', '/api/recipes/{recipe}/', None),
+    ('recipe detail, authenticated', 7, 'user', 'get',
+     '/api/recipes/{recipe}/', None),
+    ('recipe create', 18, 'user', 'post', '/api/recipes/', 'recipe_data'),
+    ('recipe update', 23, 'user', 'patch', '/api/recipes/{recipe}/',
+     'recipe_data'),
+    ('recipe delete', 18, 'user', 'delete',
+     '/api/recipes/{spare_recipe}/', None),
+    ('favorite add', 5, 'user', 'post',
+     '/api/recipes/{other_recipe}/favorite/', None),
+    ('favorite remove', 5, 'user', 'delete',
+     '/api/recipes/{other_recipe}/favorite/', None),
+    ('cart add', 6, 'user', 'post',
+     '/api/recipes/{other_recipe}/shopping_cart/', None),
+    ('cart remove', 7, 'user', 'delete',
+     '/api/recipes/{other_recipe}/shopping_cart/', None),
+    ('cart download', 2, 'user', 'get',
+     '/api/recipes/download_shopping_cart/', None),
+    ('subscriptions', 4, 'user', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', None),
+    ('subscribe', 6, 'user', 'post', '/api/users/{author}/subscribe/', None),
+    ('unsubscribe', 6, 'user', 'delete',
+     '/api/users/{author}/subscribe/', None),
+    ('users', 3, 'user', 'get', '/api/users/', None),
+    ('user detail', 2, 'user', 'get', '/api/users/{author}/', None),
+    ('me', 2, 'user', 'get', '/api/users/me/', None),
+    ('ingredients', 1, 'anonymous', 'get', '/api/ingredients/', None),
+    ('ingredient search', 1, 'anonymous', 'get',
+     '/api/ingredients/?name=ингр', None),
+    ('tags', 1, 'anonymous', 'get', '/api/tags/', None),
+    ('tag detail', 1, 'anonymous', 'get', '/api/tags/{tag}/', None),
+    ('short link', 2, 'user', 'get', '/api/recipes/{recipe}/get-link/', None),
+    ('short link redirect', 1, 'anonymous', 'get', '/s/{hash}/', None),
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(limit, using=DEFAULT_DB_ALIAS):
+    """Fails if the block runs more than ``limit`` database queries.
+
+    Works as a decorator as well. The captured queries are yielded, the
+    error lists them.
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > limit:
+        raise QueryBudgetExceeded('\n'.join([
+            f'{len(context)} queries, the budget is {limit}:',
+            *(f'  {query["sql"]}' for query in context.captured_queries),
+        ]))
+
+
+def clear_caches():
+    """Empties the shared cache and the caches of this process, so a
+    route is measured as on a cold start."""
+    cache.clear()
+    ingredient_index.invalidate()
+    recipe_search_index.invalidate()
+    short_urls.recipe_ids.clear()
+    authentication.users.clear()
+
+
+def request_route(clients, objects, client, method, url, data):
+    """Requests a route of QUERY_BUDGETS with the seeded ``objects``,
+    reading streamed responses to the end."""
+    response = getattr(clients[client], method)(
+        url.format(**objects), data and objects[data], format='json')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def get_image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), (200, 120, 60)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class QueryBudgetData:
+    """Data the routes of QUERY_BUDGETS are requested against.
+
+    Holds the requesting user, an author the user is not subscribed to
+    and their clients; ``seed()`` fills the database up to a number of
+    recipes.
+    """
+
+    def __init__(self):
+        self.user, self.client = self.create_user('budget')
+        self.author, self.author_client = self.create_user('budget-author')
+        self.image = get_image_data()
+        self.clients = {'anonymous': APIClient(), 'user': self.client}
+
+    def create_user(self, username):
+        user = User.objects.create_user(
+            email=f'{username}@example.com', username=username,
+            first_name='Имя', last_name='Фамилия', password=username)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=(
+            f'Token {Token.objects.create(user=user).key}'))
+        return user, client
+
+    def create_recipes(self, user, client, count, data):
+        for _ in range(count - user.recipes.count()):
+            response = client.post('/api/recipes/', data, format='json')
+            if response.status_code != 201:
+                raise RuntimeError(f'Cannot create a recipe: '
+                                   f'{response.content.decode()}')
+        return list(user.recipes.order_by('pk').values_list('pk', flat=True))
+
+    def seed(self, size):
+        """Fills the database up to ``size`` recipes and returns the
+        objects the route URLs refer to."""
+        call_command(
+            'generate_data', stdout=StringIO(), seed=size,
+            recipes=size - Recipe.objects.count(),
+            users=max(size // 3 - User.objects.count(), 1),
+            ingredients=size * 2, tags=6, subscriptions=3, favorites=3,
+            cart=2)
+
+        # The user's own lists grow with the data as well.
+        count = size // 10
+        ingredient_ids = list(Ingredient.objects.order_by('pk').values_list(
+            'pk', flat=True)[:5])
+        tag_ids = list(Tag.objects.order_by('pk').values_list(
+            'pk', flat=True)[:2])
+        recipe_data = {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': self.image, 'tags': tag_ids,
+            'ingredients': [{'id': pk, 'amount': 10}
+                            for pk in ingredient_ids],
+        }
+        # Recipes of both users have the same ingredients at both sizes,
+        # so adding one to the cart, which holds the user's own recipes,
+        # changes the shopping list the same way.
+        own_ids = self.create_recipes(
+            self.user, self.client, count + 1, recipe_data)
+        author_recipe_ids = self.create_recipes(
+            self.author, self.author_client, count, recipe_data)
+
+        favorites = Recipe.objects.exclude(
+            author__in=(self.user, self.author)).exclude(
+            favorites__user=self.user).order_by('pk').values_list(
+            'pk', flat=True)[:count]
+        creator_ids = User.objects.exclude(
+            pk__in=(self.user.pk, self.author.pk)).exclude(
+            subscribers__subscriber=self.user).order_by(
+            'pk').values_list('pk', flat=True)[:count]
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe_id=pk) for pk in favorites],
+            ignore_conflicts=True)
+        ShoppingCartItem.objects.bulk_create(
+            [ShoppingCartItem(user=self.user, recipe_id=pk)
+             for pk in own_ids[:count]],
+            ignore_conflicts=True)
+        ShoppingListItem.objects.rebuild([self.user.pk])
+        Subscription.objects.bulk_create(
+            [Subscription(subscriber=self.user, creator_id=pk)
+             for pk in creator_ids],
+            ignore_conflicts=True)
+
+        return {
+            'recipe': own_ids[0],
+            'spare_recipe': own_ids[-1],
+            'other_recipe': author_recipe_ids[-1],
+            'author': self.author.pk,
+            'tag': tag_ids[0],
+            'hash': RecipeShortURL.objects.filter(
+                recipe_id=own_ids[0]).values_list('hash', flat=True)[0],
+            'recipe_data': recipe_data,
+        }
+
+
+class QueryBudgetMixin:
+    """Test case mixin checking the routes of QUERY_BUDGETS against data
+    of ``query_budget_sizes``: each route within its budget, with as many
+    queries at both sizes.
+
+    Use it with a TransactionTestCase: the savepoints of a TestCase are
+    counted as queries.
+    """
+    query_budget_sizes = (10, 30)
+
+    def measure_routes(self, data, size, routes):
+        objects = data.seed(size)
+        counts = {}
+        for name, budget, *route in routes:
+            with self.subTest(name, size=size):
+                clear_caches()
+                with query_budget(budget) as queries:
+                    response = request_route(data.clients, objects, *route)
+                self.assertLess(response.status_code, 400, response)
+            counts[name] = len(queries)
+        return counts
+
+    def assert_query_budgets(self, routes=QUERY_BUDGETS):
+        data = QueryBudgetData()
+        small, large = (self.measure_routes(data, size, routes)
+                        for size in self.query_budget_sizes)
+        for name, *_ in routes:
+            with self.subTest(name):
+                self.assertEqual(large[name], small[name],
+                                 'The queries grow with the data')
@@ -1,14 +1,22 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
 
 from common.constants import EMAIL_MAX_LENGTH, NAME_MAX_LENGTH
+from common.images import get_rendition_urls
 from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                           RecipeShortURL, ShoppingCartItem, Tag)
+                           RecipeShortURL, ShoppingCartItem, ShoppingListItem,
+                           Tag)
+from recipe.search import update_search_vectors
+from recipe.short_urls import get_new_hashes
+from recipe.signals import change_ingredients_in_bulk
 from users.models import Subscription
 
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageRenditionsField
+from .instrumentation import TimedSerializerMixin
 
 User = get_user_model()
 
@@ -56,20 +64,24 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return user
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
+    avatar_renditions = ImageRenditionsField(source='avatar')
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             subscriber=request.user, creator=obj).exists()
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username',
-                  'first_name', 'last_name', 'avatar', 'is_subscribed')
+                  'first_name', 'last_name', 'avatar', 'avatar_renditions',
+                  'is_subscribed')
 
 
 class SetPasswordSerializer(serializers.Serializer):
@@ -97,14 +109,19 @@ class AvatarSerializer(serializers.Serializer):
             return obj.avatar.url
         return None
 
+    def get_avatar_renditions(self, obj):
+        if obj.avatar:
+            return get_rendition_urls(obj.avatar.name)
+        return None
+
 
-class TagReadSerializer(serializers.ModelSerializer):
+class TagReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
@@ -120,17 +137,13 @@ class IngredientAmountSerializer(serializers.Serializer):
                 {'ingredients': 'Amount should be more than 0'})
         return value
 
-    def validate_id(self, value):
-        if not Ingredient.objects.filter(id=value).exists():
-            raise serializers.ValidationError(
-                {'ingredients': f'Ingredient with id {value} does not exist.'})
-        return value
 
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField(source='image')
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ('id', 'image', 'name', 'cooking_time')
+        fields = ('id', 'image', 'image_renditions', 'name', 'cooking_time')
         validators = [
             UniqueTogetherValidator(
                 queryset=Favorite.objects.all(),
@@ -152,10 +165,11 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(required=True, allow_null=True)
+    image_renditions = ImageRenditionsField(source='image')
     author = CustomUserSerializer(read_only=True)
     tags = TagReadSerializer(many=True)
     ingredients = RecipeIngredientSerializer(
@@ -163,18 +177,22 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'search_vector')
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return ShoppingCartItem.objects.filter(
             user=request.user, recipe=obj).exists()
 
@@ -188,7 +206,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'search_vector')
 
     def validate_tags(self, tags):
         unique_tags = set(tags)
@@ -213,6 +231,15 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             else:
                 unique_ingredient_ids.add(ingredient_id)
 
+        # The ingredients are looked up at once rather than one by one.
+        missing_ids = unique_ingredient_ids.difference(
+            Ingredient.objects.filter(
+                id__in=unique_ingredient_ids).values_list('id', flat=True))
+        if missing_ids:
+            raise serializers.ValidationError(
+                {'ingredients':
+                    f'Ingredient with id {min(missing_ids)} does not exist.'})
+
         return ingredients
 
     def validate(self, data):
@@ -243,28 +270,55 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
 
         self.create_ingredients(recipe, ingredients_data)
+        update_search_vectors([recipe.pk])
 
-        recipe_short_url = RecipeShortURL.objects.create(recipe=recipe)
-        recipe_short_url.generate_hash()
+        RecipeShortURL.objects.create(
+            recipe=recipe, hash=get_new_hashes([recipe.pk])[recipe.pk])
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
 
+        # Concurrent edits of the recipe wait here, so each applies its
+        # difference to the shopping lists from the state the other left.
+        Recipe.objects.select_for_update().filter(pk=instance.pk).exists()
+
         instance = super().update(instance, validated_data)
 
         if tags_data:
             instance.tags.set(tags_data)
 
-        instance.recipeingredients.all().delete()
+        # The ingredients are replaced without the signals that change the
+        # shopping lists per row; the difference is applied once. The
+        # recipe is saved below, which invalidates the caches.
+        recipe_ingredients = instance.recipeingredients.all()
+        old_amounts = dict(
+            recipe_ingredients.values_list('ingredient_id', 'amount'))
+        with change_ingredients_in_bulk():
+            recipe_ingredients.delete()
         self.create_ingredients(instance, ingredients_data)
 
+        ShoppingListItem.objects.change_recipe(
+            instance.pk,
+            old_amounts,
+            {ingredient_data.get('id'): ingredient_data.get('amount')
+             for ingredient_data in ingredients_data}
+        )
+        update_search_vectors([instance.pk])
+
         instance.save()
         return instance
 
     def to_representation(self, instance):
+        # Written recipes come without the prefetches of the view's
+        # queryset; the ingredient rows are read with the ingredients
+        # rather than one at a time. Fetched relations are kept.
+        prefetch_related_objects([instance], 'tags', Prefetch(
+            'recipeingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')))
         read_serializer = RecipeReadSerializer(instance, context=self.context)
         return read_serializer.data
 
@@ -283,7 +337,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
 
-class RecipeShortURLSerializer(serializers.ModelSerializer):
+class RecipeShortURLSerializer(TimedSerializerMixin,
+                               serializers.ModelSerializer):
     short_link = serializers.SerializerMethodField()
 
     class Meta:
@@ -297,15 +352,17 @@ class RecipeShortURLSerializer(serializers.ModelSerializer):
         return short_url
 
 
-class CreatorSerializer(serializers.ModelSerializer):
+class CreatorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_renditions = ImageRenditionsField(source='avatar')
     recipes = ShortRecipeSerializer(many=True, read_only=True)
     recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'avatar', 'is_subscribed', 'recipes', 'recipes_count')
+                  'avatar', 'avatar_renditions', 'is_subscribed', 'recipes',
+                  'recipes_count')
         validators = [
             UniqueTogetherValidator(
                 queryset=Subscription.objects.all(),
@@ -318,26 +375,12 @@ class CreatorSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             subscriber=request.user, creator=obj).exists()
 
     def get_recipes_count(self, obj):
-        request = self.context.get('request')
-        return Recipe.objects.filter(author=request.user).count()
-
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-
-        if limit is not None:
-            try:
-                limit = int(limit)
-                if limit > 0:
-                    data['recipes'] = data['recipes'][:limit]
-            except ValueError:
-                raise serializers.ValidationError(
-                    'Invalid recipes_limit value')
-
-        return data
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
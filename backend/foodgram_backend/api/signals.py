@@ -0,0 +1,161 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from common.images import delete_renditions, schedule_renditions
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           ShoppingCartItem, Tag)
+from users.models import Subscription
+
+from .authentication import forget_token, forget_user_tokens
+from .caching import bump_cache_version
+from .ingredient_index import ingredient_index
+from .pagination import get_user_counts_namespace
+from .personalization import USER_SETS, forget_user_set
+
+User = get_user_model()
+
+# User fields shown with the authors of recipes.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    ingredient_index.invalidate()
+    bump_cache_version('ingredients')
+    bump_cache_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_cache_version('tags')
+    bump_cache_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(sender, **kwargs):
+    bump_cache_version('recipes')
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, update_fields=None, raw=False,
+                           **kwargs):
+    instance.author_fields_changed = False
+    instance.old_avatar = None
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = fields.intersection(update_fields)
+    if raw or instance.pk is None or not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values(*fields).first()
+    instance.author_fields_changed = old is None or any(
+        getattr(instance, field) != value for field, value in old.items())
+    instance.old_avatar = old and old.get('avatar')
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(sender, instance, **kwargs):
+    # Logins, password changes and new users do not alter recipes.
+    if getattr(instance, 'author_fields_changed', False):
+        bump_cache_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_paginated_counts(sender, **kwargs):
+    bump_cache_version('counts')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_counts(sender, created, **kwargs):
+    # Lists count users, not their fields.
+    if created:
+        bump_cache_version('counts')
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_counts(sender, **kwargs):
+    bump_cache_version('counts')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCartItem)
+def invalidate_own_counts(sender, instance, **kwargs):
+    # Only the user's is_favorited and is_in_shopping_cart lists change.
+    bump_cache_version(get_user_counts_namespace(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_subscription_counts(sender, instance, **kwargs):
+    bump_cache_version(get_user_counts_namespace(instance.subscriber_id))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCartItem)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_user_set(sender, instance, **kwargs):
+    user_field, _ = USER_SETS[sender]
+    # After the commit, so the set is not read again from the old rows.
+    transaction.on_commit(partial(
+        forget_user_set, getattr(instance, f'{user_field}_id'), sender))
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, raw=False, **kwargs):
+    instance.old_image = None
+    if not raw and instance.pk is not None:
+        instance.old_image = Recipe.objects.filter(
+            pk=instance.pk).values_list('image', flat=True).first()
+
+
+def delete_unused_renditions(name):
+    # Generated data shares one image between recipes.
+    if not (Recipe.objects.filter(image=name).exists()
+            or User.objects.filter(avatar=name).exists()):
+        delete_renditions(name)
+
+
+def delete_replaced_renditions(old_name, name):
+    if old_name and old_name != name:
+        transaction.on_commit(partial(delete_unused_renditions, old_name))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    delete_replaced_renditions(
+        getattr(instance, 'old_image', None), instance.image.name)
+    schedule_renditions(
+        instance.image.name, partial(bump_cache_version, 'recipes'))
+
+
+@receiver(post_save, sender=User)
+def process_avatar(sender, instance, update_fields=None, **kwargs):
+    delete_replaced_renditions(
+        getattr(instance, 'old_avatar', None), instance.avatar.name)
+    if update_fields and 'avatar' not in update_fields:
+        return
+    schedule_renditions(
+        instance.avatar.name, partial(bump_cache_version, 'recipes'))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_renditions(sender, instance, **kwargs):
+    delete_replaced_renditions(instance.image.name, None)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    # Covers password changes, deactivation and profile updates.
+    forget_user_tokens(instance)
@@ -0,0 +1,842 @@
+import base64
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+from io import BytesIO
+from unittest import mock
+from urllib.parse import unquote
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+
+from common.constants import (IMAGE_UPLOAD_MAX_PIXELS, IMAGE_UPLOAD_MAX_SIZE,
+                              SHORT_URL_LRU_TIMEOUT)
+from common.images import (generate_renditions, get_rendition_urls,
+                           renditions_ready)
+from recipe import short_urls
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           RecipeShortURL, ShoppingCartItem, ShoppingListItem,
+                           Tag)
+from recipe.search import recipe_search_index
+from recipe.short_urls import encode_recipe_id
+from users.models import Subscription
+
+from . import authentication
+from .caching import (bump_cache_version, get_cache_stats, get_cache_version,
+                      record_cache_access)
+from .fields import Base64ImageField
+from .instrumentation import Config, config, get_default_config
+from .metrics import MetricsRegistry, write_snapshot
+from .pagination import get_user_counts_namespace
+from .profiling import list_profiles
+from .query_budget import QueryBudgetMixin, clear_caches
+from .serializers import CreatorSerializer
+
+User = get_user_model()
+
+
+class APITestCase(TestCase):
+    """Users, a tag and ingredients, with helpers to create recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('user')
+        cls.author = cls.create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        ]
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            email=f'{username}@example.com', username=username,
+            first_name='Имя', last_name='Фамилия', password=username)
+
+    def setUp(self):
+        clear_caches()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, author, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/recipe.png')
+            recipe.tags.add(self.tag)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in self.ingredients)
+            recipes.append(recipe)
+        return recipes
+
+    def mark_recipes(self, user, recipes):
+        for model in (Favorite, ShoppingCartItem):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe) for recipe in recipes)
+        Subscription.objects.get_or_create(
+            subscriber=user, creator=recipes[0].author)
+
+    def get(self, client, url):
+        # Every request is measured without cached responses.
+        clear_caches()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+
+class RecipeQueryCountTests(APITestCase):
+    """Recipe pages take a fixed number of queries, whatever the rows."""
+
+    def assert_page_queries(self, client, count, url='/api/recipes/'):
+        with self.assertNumQueries(count):
+            self.get(client, url)
+        # A full page of recipes, marked by the user.
+        self.mark_recipes(self.user, self.create_recipes(self.author, 5))
+        with self.assertNumQueries(count):
+            return self.get(client, url)
+
+    def test_list_anonymous(self):
+        self.create_recipes(self.author, 1)
+        response = self.assert_page_queries(self.anonymous, 4)
+        self.assertFalse(response.json()['results'][0]['is_favorited'])
+
+    def test_list_authenticated(self):
+        self.mark_recipes(self.user, self.create_recipes(self.author, 1))
+        response = self.assert_page_queries(self.client, 7)
+        recipe = response.json()['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_detail_anonymous(self):
+        recipe, = self.create_recipes(self.author, 1)
+        self.assert_page_queries(self.anonymous, 3,
+                                 url=f'/api/recipes/{recipe.pk}/')
+
+    def test_detail_authenticated(self):
+        recipe, = self.create_recipes(self.author, 1)
+        self.mark_recipes(self.user, [recipe])
+        response = self.assert_page_queries(
+            self.client, 6, url=f'/api/recipes/{recipe.pk}/')
+        self.assertTrue(response.json()['is_favorited'])
+
+    def assert_filtered_page(self, url, model, flag):
+        """The user's own marks select the recipes through the annotations,
+        bypassing the shared cache."""
+        self.mark_recipes(self.user, self.create_recipes(self.author, 1))
+        response = self.assert_page_queries(self.client, 5, url=url)
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(response.json()['count'], 6)
+        for recipe in response.json()['results']:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertTrue(recipe['author']['is_subscribed'])
+
+        model.objects.filter(user=self.user).delete()
+        for recipe in self.get(self.client, url).json()['results']:
+            self.assertFalse(recipe[flag])
+
+    def test_favorited_filter(self):
+        self.assert_filtered_page('/api/recipes/?is_favorited=1',
+                                  ShoppingCartItem, 'is_in_shopping_cart')
+
+    def test_shopping_cart_filter(self):
+        self.assert_filtered_page('/api/recipes/?is_in_shopping_cart=1',
+                                  Favorite, 'is_favorited')
+
+
+class SubscriptionTests(APITestCase):
+
+    def subscribe(self, *creators):
+        for creator in creators:
+            Subscription.objects.create(subscriber=self.user, creator=creator)
+
+    def test_subscriptions_in_subscription_order(self):
+        # Usernames sort the other way round.
+        creators = [self.create_user(username) for username in 'cba']
+        self.subscribe(*creators)
+
+        response = self.get(self.client, '/api/users/subscriptions/')
+        self.assertEqual(
+            [creator['username'] for creator in response.json()['results']],
+            ['c', 'b', 'a'])
+
+    def test_recipes_limit(self):
+        self.create_recipes(self.author, 4)
+        self.create_recipes(self.user, 1)
+        self.subscribe(self.author)
+
+        for limit, shown in (('2', 2), ('10', 4), ('0', 4)):
+            with self.subTest(recipes_limit=limit):
+                response = self.get(
+                    self.client,
+                    f'/api/users/subscriptions/?recipes_limit={limit}')
+                creator, = response.json()['results']
+                self.assertEqual(len(creator['recipes']), shown)
+                # The creator's recipes are counted, not the requester's.
+                self.assertEqual(creator['recipes_count'], 4)
+
+        # The latest recipes are shown.
+        latest = Recipe.objects.filter(author=self.author).values_list(
+            'pk', flat=True)[:2]
+        response = self.get(
+            self.client, '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results'][0][
+                'recipes']], list(latest))
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=many')
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipes_count_without_annotation(self):
+        self.create_recipes(self.author, 3)
+        self.create_recipes(self.user, 1)
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+
+        data = CreatorSerializer(
+            User.objects.get(pk=self.author.pk),
+            context={'request': request}).data
+        self.assertEqual(data['recipes_count'], 3)
+        self.assertFalse(data['is_subscribed'])
+
+    def test_subscribe_response(self):
+        recipes = self.create_recipes(self.author, 3)
+
+        response = self.client.post(
+            f'/api/users/{self.author.pk}/subscribe/?recipes_limit=2')
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual(data['id'], self.author.pk)
+        self.assertEqual(data['username'], self.author.username)
+        self.assertTrue(data['is_subscribed'])
+        self.assertEqual(data['recipes_count'], 3)
+        self.assertEqual([recipe['id'] for recipe in data['recipes']],
+                         [recipe.pk for recipe in recipes[:0:-1]])
+        self.assertEqual(set(data['recipes'][0]),
+                         {'id', 'name', 'image', 'image_renditions',
+                          'cooking_time'})
+        self.assertTrue(Subscription.objects.filter(
+            subscriber=self.user, creator=self.author).exists())
+
+        response = self.client.post(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingCartDownloadTests(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(self.author, 1)
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+
+    def download(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(self.url, **headers)
+        content = b''
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        return response, content
+
+    def test_unchanged_list_not_modified(self):
+        response, content = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ингредиент 0'.encode(), content)
+        response, _ = self.download(response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_rendered_content(self):
+        etag = self.download()[0]['ETag']
+
+        RecipeIngredient.objects.filter(
+            recipe=self.recipe, ingredient=self.ingredients[0]
+        ).update(amount=20)
+        ShoppingListItem.objects.rebuild([self.user.pk])
+        response, _ = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        Ingredient.objects.filter(pk=self.ingredients[0].pk).update(
+            name='переименованный')
+        response, content = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('переименованный'.encode(), content)
+
+
+class RecipeWriteTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.recipe, = self.create_recipes(self.author, 1)
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+
+    def get_shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient_id', 'total_amount'))
+
+    def test_update_changes_shopping_lists(self):
+        first, second, third = self.ingredients
+        response = self.author_client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {
+                'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': first.pk, 'amount': 30},
+                                {'id': third.pk, 'amount': 5}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_shopping_list(),
+                         {first.pk: 30, third.pk: 5})
+
+    def test_delete_empties_shopping_lists(self):
+        response = self.author_client.delete(
+            f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_shopping_list(), {})
+
+
+class IngredientSearchTests(APITestCase):
+
+    def search(self, name):
+        response = self.anonymous.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_changes_of_other_processes(self):
+        self.assertEqual(self.search('сах'), [])
+        # Another process adds rows without signals and bumps the version.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='сахар', measurement_unit='г')])
+        bump_cache_version('ingredients')
+        self.assertEqual(self.search('сах'), ['сахар'])
+
+
+class RecipeSearchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        recipe_search_index.invalidate()
+
+    def search(self, query):
+        return self.get(
+            self.anonymous,
+            f'/api/recipes/?search={query}&limit=3').json()
+
+    def test_ranked_by_field(self):
+        in_text, in_name, other = self.create_recipes(self.author, 3)
+        Recipe.objects.filter(pk=in_text.pk).update(text='Суп из тыквы')
+        Recipe.objects.filter(pk=in_name.pk).update(name='Суп')
+        recipe_search_index.invalidate()
+
+        data = self.search('суп')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         [in_name.pk, in_text.pk])
+
+    def test_all_matches_counted(self):
+        Recipe.objects.bulk_create(
+            Recipe(author=self.author, name=f'Суп {number}', text='Описание',
+                   cooking_time=10, image='recipes/images/recipe.png')
+            for number in range(1200))
+
+        data = self.search('суп')
+        self.assertEqual(data['count'], 1200)
+        # Equal ranks come newest first.
+        self.assertEqual([recipe['name'] for recipe in data['results']],
+                         ['Суп 1199', 'Суп 1198', 'Суп 1197'])
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        recipes = self.create_recipes(self.author, 5)
+        # Equal positions leave the order to the primary keys.
+        Recipe.objects.update(pub_date=recipes[0].pub_date)
+        self.ids = sorted((recipe.pk for recipe in recipes), reverse=True)
+
+    def walk(self, url, link):
+        """Follows ``link`` from ``url``; returns the ids of every page and
+        the last page."""
+        pages = []
+        while url:
+            page = self.get(self.anonymous, url).json()
+            pages.append([recipe['id'] for recipe in page['results']])
+            url = page[link]
+        return pages, page
+
+    def test_forward_and_back(self):
+        pages, last_page = self.walk('/api/recipes/?cursor=&limit=2', 'next')
+        self.assertEqual(pages, [self.ids[:2], self.ids[2:4], self.ids[4:]])
+
+        pages, first_page = self.walk(last_page['previous'], 'previous')
+        self.assertEqual(pages, [self.ids[2:4], self.ids[:2]])
+        self.assertIsNotNone(first_page['next'])
+
+    def test_limit(self):
+        page = self.get(self.anonymous, '/api/recipes/?cursor=&limit=3')
+        self.assertEqual(
+            [recipe['id'] for recipe in page.json()['results']],
+            self.ids[:3])
+        page = self.get(self.anonymous, page.json()['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in page.json()['results']],
+            self.ids[3:])
+
+    def test_invalid_cursor(self):
+        page = self.get(self.anonymous, '/api/recipes/?cursor=&limit=2')
+        cursor = page.json()['next'].split('cursor=')[1].split('&')[0]
+        position, pk, reverse = base64.b64decode(
+            unquote(cursor)).decode().split('|')
+        for cursor in ('garbage', '%ff', f'{position}|{pk}',
+                       f'{position}|{pk}|{reverse}|0', f'{position}|x|0',
+                       f'not a date|{pk}|0', f'{position}|{pk}|yes'):
+            with self.subTest(cursor):
+                if '|' in cursor:
+                    cursor = base64.b64encode(cursor.encode()).decode()
+                response = self.anonymous.get(
+                    '/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class PaginatedCountTests(APITestCase):
+
+    def count(self, client, url):
+        # Counts come from the cache, which is not cleared here.
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['count']
+
+    def test_own_lists_scoped_to_user(self):
+        recipe, = self.create_recipes(self.author, 1)
+        url = '/api/recipes/?is_favorited=1'
+        self.assertEqual(self.count(self.client, url), 0)
+        namespaces = ('counts', get_user_counts_namespace(self.author.pk))
+        versions = [get_cache_version(namespace) for namespace in namespaces]
+
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(self.count(self.client, url), 1)
+        # Counts of other users and of shared lists are kept.
+        self.assertEqual(
+            [get_cache_version(namespace) for namespace in namespaces],
+            versions)
+
+    def test_shared_lists(self):
+        self.create_recipes(self.author, 1)
+        self.assertEqual(self.count(self.anonymous, '/api/recipes/'), 1)
+        self.assertEqual(self.count(self.client, '/api/recipes/'), 1)
+        self.create_recipes(self.author, 1)
+        self.assertEqual(self.count(self.anonymous, '/api/recipes/'), 2)
+        self.assertEqual(self.count(self.client, '/api/recipes/'), 2)
+
+
+class CacheInvalidationTests(APITestCase):
+
+    def test_author_changes(self):
+        version = get_cache_version('recipes')
+        self.author.is_staff = True
+        self.author.save()
+        self.author.last_login = self.author.date_joined
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(get_cache_version('recipes'), version)
+
+        self.author.first_name = 'Другое'
+        self.author.save()
+        self.assertNotEqual(get_cache_version('recipes'), version)
+
+    def test_cache_stats(self):
+        hits, misses = get_cache_stats('tests')
+        record_cache_access('tests', True)
+        record_cache_access('tests', False)
+        record_cache_access('tests', False)
+        self.assertEqual(get_cache_stats('tests'), (hits + 1, misses + 2))
+
+    def test_user_sets(self):
+        recipe, = self.create_recipes(self.author, 1)
+        url = f'/api/recipes/{recipe.pk}/'
+        self.assertFalse(self.client.get(url).json()['is_favorited'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        self.assertTrue(self.client.get(url).json()['is_favorited'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{url}favorite/')
+        self.assertFalse(self.client.get(url).json()['is_favorited'])
+
+
+class ShortLinkTests(APITestCase):
+
+    def get_short_link(self, recipe):
+        response = self.get(
+            self.anonymous, f'/api/recipes/{recipe.pk}/get-link/')
+        return response.json()['short-link']
+
+    def test_link_saved(self):
+        recipe, = self.create_recipes(self.author, 1)
+        link = self.get_short_link(recipe)
+        short_url = RecipeShortURL.objects.get(recipe=recipe)
+        self.assertTrue(link.endswith(f'/s/{short_url.hash}'))
+        self.assertEqual(self.get_short_link(recipe), link)
+
+    def test_taken_code_not_reused(self):
+        recipe, other = self.create_recipes(self.author, 2)
+        # A link imported from another database holds the recipe's code.
+        code = encode_recipe_id(recipe.pk)
+        RecipeShortURL.objects.create(recipe=other, hash=code)
+
+        link = self.get_short_link(recipe)
+        self.assertNotIn(code, link)
+        self.assertEqual(RecipeShortURL.objects.filter(
+            recipe=recipe).count(), 1)
+
+    def test_deleted_recipes_not_redirected(self):
+        recipe, other = self.create_recipes(self.author, 2)
+        RecipeShortURL.objects.create(recipe=other, hash='Stored01')
+        hashes = (encode_recipe_id(recipe.pk), 'Stored01')
+        for hash in hashes:
+            self.assertEqual(
+                self.anonymous.get(f'/s/{hash}/').status_code, 302)
+
+        Recipe.objects.filter(pk__in=(recipe.pk, other.pk)).delete()
+        for hash in hashes:
+            self.assertIsNone(cache.get(short_urls.get_cache_key(hash)))
+            self.assertEqual(
+                self.anonymous.get(f'/s/{hash}/').status_code, 404)
+
+    def test_process_cache_expires(self):
+        recipe, = self.create_recipes(self.author, 1)
+        hash = encode_recipe_id(recipe.pk)
+        self.assertEqual(short_urls.resolve_short_url(hash), recipe.pk)
+        self.assertEqual(short_urls.recipe_ids.get(hash), recipe.pk)
+
+        expired = time.monotonic() + SHORT_URL_LRU_TIMEOUT + 1
+        with mock.patch('common.lru.time.monotonic', return_value=expired):
+            self.assertIsNone(short_urls.recipe_ids.get(hash))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RenditionTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, self.other = self.create_recipes(self.author, 2)
+        self.store_image('recipes/images/old.png')
+        self.store_image('recipes/images/new.png')
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image='recipes/images/old.png')
+        self.recipe.refresh_from_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(default_storage.location, ignore_errors=True)
+        super().tearDownClass()
+
+    def store_image(self, name):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+        generate_renditions(name)
+
+    def test_ready_remembered(self):
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.assertIsNotNone(get_rendition_urls(self.recipe.image.name))
+        exists.assert_not_called()
+
+    def test_replaced_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.image = 'recipes/images/new.png'
+            self.recipe.save()
+        self.assertFalse(renditions_ready('recipes/images/old.png'))
+        self.assertTrue(renditions_ready('recipes/images/new.png'))
+
+    def test_shared_image_kept(self):
+        Recipe.objects.filter(pk=self.other.pk).update(
+            image='recipes/images/old.png')
+        self.other.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertTrue(renditions_ready('recipes/images/old.png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertFalse(renditions_ready('recipes/images/old.png'))
+
+
+class Base64ImageFieldTests(TestCase):
+
+    @staticmethod
+    def encode(content, mime='png'):
+        return (f'data:image/{mime};base64,'
+                + base64.b64encode(content).decode())
+
+    @staticmethod
+    def create_image(format='PNG', size=(8, 8)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 120, 60)).save(buffer, format)
+        return buffer.getvalue()
+
+    @staticmethod
+    def create_png_header(width, height):
+        # Enough of a PNG for Pillow to read the size, without pixels.
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data)))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack(
+                    '>IIBBBBB', width, height, 1, 0, 0, 0, 0))
+                + chunk(b'IDAT', b''))
+
+    def create_padded_data(self):
+        """A valid image whose base64 ends with padding."""
+        content = self.create_image()
+        if not len(content) % 3:
+            content += b'\0'
+        return self.encode(content)
+
+    def assert_rejected(self, data, code, **kwargs):
+        with self.assertRaises(ValidationError) as context:
+            Base64ImageField(**kwargs).to_internal_value(data)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_round_trip(self):
+        content = self.create_image()
+        upload = Base64ImageField().to_internal_value(self.encode(content))
+        self.assertEqual(upload.read(), content)
+        self.assertEqual(upload.content_type, 'image/png')
+
+    def test_mime_mismatch(self):
+        self.assert_rejected(
+            self.encode(self.create_image(), mime='jpeg'), 'mime_mismatch')
+
+    def test_unsupported_types(self):
+        for mime in ('svg+xml', 'bmp'):
+            with self.subTest(mime):
+                self.assert_rejected(self.encode(
+                    b'<svg xmlns="http://www.w3.org/2000/svg"/>', mime=mime),
+                    'invalid_mime')
+
+    def test_bad_padding(self):
+        data = self.create_padded_data()
+        self.assert_rejected(data[:-1], 'invalid_base64')
+        self.assert_rejected(data[:-2] + '=A', 'invalid_base64')
+
+    def test_trailing_data(self):
+        data = self.create_padded_data() + 'AAAA'
+        self.assert_rejected(data, 'invalid_base64')
+        # Padding at the end of a chunk, with data in the next one.
+        chunk_size = len(data) - len('data:image/png;base64,') - 4
+        with mock.patch('api.fields.BASE64_CHUNK_SIZE', chunk_size):
+            self.assert_rejected(data, 'invalid_base64')
+
+    def test_max_size(self):
+        data = self.encode(b'') + 'A' * (IMAGE_UPLOAD_MAX_SIZE // 3 + 1) * 4
+        self.assert_rejected(data, 'max_size')
+
+    def test_max_pixels(self):
+        side = int(IMAGE_UPLOAD_MAX_PIXELS ** 0.5) + 1
+        self.assert_rejected(
+            self.encode(self.create_png_header(side, side)), 'max_pixels')
+        # Pillow refuses decompression bombs before the size is checked.
+        self.assert_rejected(
+            self.encode(self.create_png_header(side * 10, side * 10)),
+            'max_pixels')
+
+
+class CachedUserTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_token_cached(self, cached=True):
+        for user in (authentication.users.get(self.token.key),
+                     cache.get(authentication.get_cache_key(self.token.key))):
+            self.assertEqual(user is not None, cached)
+
+    def assert_unauthorized(self):
+        self.assert_token_cached(False)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_writes_keep_other_changes(self):
+        # Caches the user.
+        self.get(self.client, '/api/users/me/')
+        # Changed elsewhere while the cached copy stays.
+        User.objects.filter(pk=self.user.pk).update(first_name='Другое')
+
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'user', 'new_password': 'Pa55-word-new'})
+        self.assertEqual(response.status_code, 204, response.content)
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Другое')
+        self.assertTrue(user.check_password('Pa55-word-new'))
+
+    def test_password_not_cached(self):
+        self.get(self.client, '/api/users/me/')
+        user = cache.get(authentication.get_cache_key(self.token.key))
+        self.assertIn('password', user.get_deferred_fields())
+        # Read from the database when asked for.
+        self.assertTrue(user.check_password('user'))
+
+    def test_logout(self):
+        self.get(self.client, '/api/users/me/')
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_unauthorized()
+
+    def test_password_change(self):
+        self.get(self.client, '/api/users/me/')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'user', 'new_password': 'Pa55-word-new'})
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assert_token_cached(False)
+
+    def test_deactivation(self):
+        self.client.get('/api/users/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assert_unauthorized()
+
+    def test_deactivate_users(self):
+        self.client.get('/api/users/me/')
+        self.assert_token_cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            authentication.deactivate_users(
+                User.objects.filter(pk=self.user.pk))
+        self.assert_unauthorized()
+
+
+class InstrumentationTests(APITestCase):
+
+    def test_config_file_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'instrumentation.json')
+            worker, command = Config(path, refresh=0), Config(path)
+            self.assertTrue(command.is_shared)
+            self.assertEqual(worker.get(), get_default_config())
+
+            command.update(enabled=True, profile_sample_rate=0.5)
+            command.update(max_queries=3)
+            options = worker.get()
+            self.assertTrue(options['enabled'])
+            self.assertEqual(options['profile_sample_rate'], 0.5)
+            self.assertEqual(options['max_queries'], 3)
+
+            command.reset()
+            self.assertEqual(worker.get(), get_default_config())
+
+    def test_local_cache_not_shared(self):
+        self.assertFalse(Config().is_shared)
+
+    def test_serialize_timing(self):
+        self.create_recipes(self.author, 2)
+        options = {**get_default_config(), 'enabled': True}
+        with mock.patch.object(config, 'get', return_value=options):
+            response = self.get(self.client, '/api/recipes/')
+        timings = {
+            name: float(duration.split('=')[1])
+            for name, duration, *_ in (
+                timing.split(';')
+                for timing in response['Server-Timing'].split(', '))
+        }
+        self.assertEqual(
+            set(timings), {'db', 'view', 'serialize', 'render', 'total'})
+        self.assertGreater(timings['serialize'], 0)
+
+
+class MetricsFilesTests(TestCase):
+
+    def test_dead_workers_folded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = MetricsRegistry(directory)
+            labels = (('view', 'RecipeViewSet'),)
+            for pid in (101, 102):
+                worker = MetricsRegistry(directory)
+                worker.inc('foodgram_requests_total', labels, pid)
+                worker.observe('foodgram_request_db_queries', labels, 3)
+                write_snapshot(worker.get_path(pid), worker.snapshot())
+            expected = registry.collect()
+
+            registry.mark_process_dead(101)
+            registry.mark_process_dead(102)
+            registry.mark_process_dead(103)
+            self.assertEqual(set(os.listdir(directory)), {
+                'metrics-dead.json', f'metrics-{os.getpid()}.json'})
+            self.assertEqual(registry.collect(), expected)
+            counters, _ = expected
+            self.assertEqual(
+                counters['foodgram_requests_total', labels], 203)
+
+            registry.clear()
+            self.assertEqual(os.listdir(directory), [])
+
+
+class ProfilingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_streamed_response_profiled(self):
+        recipe, = self.create_recipes(self.author, 1)
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PROFILING_DIR=directory):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/', HTTP_X_PROFILE='1')
+            self.assertTrue(response.streaming)
+            # Saved once the body is sent.
+            self.assertEqual(list_profiles(), [])
+            b''.join(response.streaming_content)
+
+            profile, = list_profiles()
+        self.assertEqual(profile['reason'], 'header')
+        self.assertEqual(profile['status'], 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+@mock.patch('api.signals.schedule_renditions')
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """The routes of QUERY_BUDGETS within their budgets, with as many
+    queries on small and larger data."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(default_storage.location, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_routes(self, schedule_renditions):
+        self.assert_query_budgets()
@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
+from .metrics import metrics_view
 from .views import (IngredientListRetrieveViewSet, RecipeViewSet,
                     TagListRetrieveViewSet, UserViewSet)
 
@@ -15,5 +16,6 @@ router_v1.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router_v1.urls)),
 ]
@@ -1,7 +1,14 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Subquery, Value)
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -11,13 +18,22 @@ from rest_framework.permissions import (AllowAny, IsAuthenticated,
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from recipe.models import (Favorite, Ingredient, Recipe, RecipeShortURL,
-                           ShoppingCartItem, Tag)
+from common.constants import RECIPE_CACHE_TIMEOUT, RECIPE_MAX_AGE
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           RecipeShortURL, ShoppingCartItem, ShoppingListItem,
+                           Tag)
+from recipe.short_urls import get_new_hashes
+from recipe.signals import change_ingredients_in_bulk
 from users.models import Subscription
 
+from .caching import CachedResponseMixin, bump_cache_version
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageLimitPagination
+from .ingredient_index import ingredient_index
+from .pagination import CachedCountPagination, PageLimitKeysetPagination
 from .permissions import IsAuthorOrReadOnly
+from .personalization import personalize_recipes
+from .renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                        ShoppingListTextRenderer)
 from .serializers import (AvatarSerializer, CreatorSerializer,
                           CustomUserCreateSerializer, CustomUserSerializer,
                           IngredientSerializer, RecipeShortURLSerializer,
@@ -30,7 +46,7 @@ User = get_user_model()
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = (IsAuthenticated,)
-    pagination_class = PageLimitPagination
+    pagination_class = CachedCountPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -44,6 +60,18 @@ class UserViewSet(viewsets.ModelViewSet):
             return [IsAuthorOrReadOnly(), IsAuthenticated()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+
+        if not user.is_authenticated:
+            return queryset
+
+        return queryset.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                subscriber=user, creator=OuterRef('pk')))
+        )
+
     @action(methods=['POST', 'DELETE'], detail=True, url_path='subscribe')
     def toggle_subscription(self, request, pk=None):
         subscriber = request.user
@@ -65,8 +93,12 @@ class UserViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            creators = self.get_creators_queryset().annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+            )
             subscription = Subscription.objects.create(
                 subscriber=subscriber, creator=creator)
+            creator = creators.get(pk=creator.pk)
             serializer = CreatorSerializer(
                 creator, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -78,10 +110,43 @@ class UserViewSet(viewsets.ModelViewSet):
             else:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+
+        if limit is None:
+            return None
+
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError('Invalid recipes_limit value')
+
+        return limit if limit > 0 else None
+
+    def get_creators_queryset(self):
+        recipes = Recipe.objects.all()
+        limit = self.get_recipes_limit()
+
+        if limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')).values('pk')[:limit]
+            ))
+
+        return User.objects.annotate(
+            recipes_count=Count('recipes', distinct=True),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
+
     @action(methods=['GET'], detail=False, url_path='subscriptions')
     def get_mysubscriptions(self, request):
-        subscriptions = request.user.following.all()
-        creators = [subscription.creator for subscription in subscriptions]
+        # Creators come in the order they were subscribed to.
+        creators = self.get_creators_queryset().filter(
+            subscribers__subscriber=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('subscribers__pk')
         result_page = self.paginate_queryset(creators)
 
         serializer = CreatorSerializer(
@@ -89,6 +154,11 @@ class UserViewSet(viewsets.ModelViewSet):
 
         return self.get_paginated_response(serializer.data)
 
+    def get_current_user(self):
+        # request.user may come from the authentication caches, so writes
+        # go to a fresh row and save only the fields they change.
+        return User.objects.get(pk=self.request.user.pk)
+
     @action(methods=['GET'], detail=False, url_path='me')
     def me_page(self, request):
         user = request.user
@@ -100,18 +170,22 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = AvatarSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = request.user
+        user = self.get_current_user()
         user.avatar = serializer.validated_data.get('avatar')
-        user.save()
+        user.save(update_fields=['avatar'])
 
         avatar_url = serializer.get_avatar_url(user)
-        return Response({'avatar': avatar_url}, status=status.HTTP_200_OK)
+        return Response({
+            'avatar': avatar_url,
+            'avatar_renditions': serializer.get_avatar_renditions(user),
+        }, status=status.HTTP_200_OK)
 
     @avatar.mapping.delete
     def delete_avatar(self, request):
-        user = request.user
-        user.avatar.delete()
-        user.save()
+        user = self.get_current_user()
+        # The renditions go with the avatar, see api.signals.
+        user.avatar.delete(save=False)
+        user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['POST'], detail=False, url_path='set_password')
@@ -122,42 +196,141 @@ class UserViewSet(viewsets.ModelViewSet):
         new_password = serializer.validated_data.get('new_password')
         current_password = serializer.validated_data.get('current_password')
 
-        user = request.user
+        user = self.get_current_user()
         if not user.check_password(current_password):
             raise ValidationError('Invalid current password')
 
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
 
         return Response('Password has been changed',
                         status=status.HTTP_204_NO_CONTENT)
 
 
-class TagListRetrieveViewSet(ReadOnlyModelViewSet):
+class TagListRetrieveViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagReadSerializer
     pagination_class = None
 
 
-class IngredientListRetrieveViewSet(ReadOnlyModelViewSet):
+class IngredientListRetrieveViewSet(CachedResponseMixin,
+                                    ReadOnlyModelViewSet):
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(self.search, request)
+
+    def search(self, request):
+        return HttpResponse(
+            ingredient_index.search(request.query_params.get('name')),
+            content_type='application/json'
+        )
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.select_related(
-        'author').prefetch_related('ingredients', 'tags')
+class RecipeViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'recipes'
+    cache_timeout = RECIPE_CACHE_TIMEOUT
+    cache_max_age = RECIPE_MAX_AGE
+    cache_vary_headers = ('Accept', 'Authorization')
+    queryset = Recipe.objects.defer('search_vector').select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipeingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )
+    )
     permission_classes = (IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly)
     serializer_class = RecipeWriteSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageLimitPagination
+    pagination_class = PageLimitKeysetPagination
+
+    def should_cache_response(self, request):
+        # Filters by the user's own marks select different recipes per user.
+        if request.user.is_authenticated and (
+                'is_favorited' in request.query_params
+                or 'is_in_shopping_cart' in request.query_params):
+            return False
+        return super().should_cache_response(request)
+
+    def get_shared_response(self, view, request, *args, **kwargs):
+        # The shared body is the anonymous one; flags are overlaid later.
+        user = request.user
+        request.user = AnonymousUser()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            request.user = user
+
+    def personalize_content(self, request, content):
+        if not request.user.is_authenticated:
+            return None
+        return personalize_recipes(content, request.user)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Recipe ingredients are bulk created, which sends no signals.
+        bump_cache_version('recipes')
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_cache_version('recipes')
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # The carts lose the recipe at once rather than per ingredient.
+        ShoppingListItem.objects.change_recipe(instance.pk, {
+            recipe_ingredient.ingredient_id: recipe_ingredient.amount
+            for recipe_ingredient in instance.recipeingredients.all()
+        }, {})
+        with change_ingredients_in_bulk():
+            instance.delete()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+
+        if not user.is_authenticated:
+            return queryset
+
+        authors = User.objects.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                subscriber=user, creator=OuterRef('pk')))
+        )
+
+        return queryset.select_related(None).prefetch_related(
+            Prefetch('author', queryset=authors)
+        ).annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCartItem.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
 
     @action(detail=True, url_path='get-link')
     def get_short_link(self, request, pk):
-        short_url = RecipeShortURL.objects.get(recipe__id=pk)
+        short_url = RecipeShortURL.objects.filter(recipe_id=pk).first()
+
+        if short_url is None:
+            # Recipes saved without a link get one, checked against the
+            # hashes already taken.
+            recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+            try:
+                with transaction.atomic():
+                    short_url = RecipeShortURL.objects.create(
+                        recipe=recipe,
+                        hash=get_new_hashes([recipe.pk])[recipe.pk])
+            except IntegrityError:
+                # Created by a concurrent request.
+                short_url = RecipeShortURL.objects.filter(
+                    recipe=recipe).first()
 
         serializer = RecipeShortURLSerializer(
             short_url, context={'request': request})
@@ -175,35 +348,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def toggle_shopping_cart_item(self, request, pk):
         return self.update_recipe_status(request, ShoppingCartItem, pk)
 
-    @action(methods=['GET'], detail=False, url_path='download_shopping_cart')
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='download_shopping_cart',
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingListTextRenderer, ShoppingListCSVRenderer,
+                          ShoppingListJSONRenderer)
+    )
     def download_shopping_cart(self, request):
-        ingredients = (
-            Ingredient.objects.filter(
-                recipes__shopping_cart_items__user=request.user)
-            .annotate(total_amount=Sum('recipeingredients__amount'))
-            .values('name', 'measurement_unit', 'total_amount')
+        renderer = request.accepted_renderer
+        # A list holds at most one row per ingredient of the catalog.
+        ingredients = list(
+            ShoppingListItem.objects.filter(user=request.user)
+            .values('total_amount',
+                    name=F('ingredient__name'),
+                    measurement_unit=F('ingredient__measurement_unit'))
+            .order_by('measurement_unit', 'name')
         )
+        etag = self.get_shopping_cart_etag(ingredients, renderer.format)
 
-        shopping_list_items = '\n'.join(
-            f'{ingredient["name"]}: '
-            f'{ingredient["total_amount"]} '
-            f'{ingredient["measurement_unit"]}'
-            for ingredient in ingredients
-        )
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
 
-        return HttpResponse(
-            shopping_list_items,
-            headers={
-                "Content-Type": "text/plain",
-                "Content-Disposition": (
-                    'attachment; filename="shopping_list.txt"'
-                ),
-            },
+        response = StreamingHttpResponse(
+            renderer.render(iter(ingredients)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
+        response['ETag'] = etag
+        return response
+
+    def get_shopping_cart_etag(self, ingredients, format):
+        # Hashes exactly what is rendered, so amounts changed in place and
+        # renamed ingredients change the ETag as well.
+        digest = hashlib.md5(format.encode())
+        for ingredient in ingredients:
+            digest.update('\0{name}\0{measurement_unit}\0{total_amount}'
+                          .format(**ingredient).encode())
+        return quote_etag(digest.hexdigest())
 
     def update_recipe_status(self, request, model, pk):
         user = request.user
-        recipe = get_object_or_404(self.get_queryset(), pk=pk)
+        recipe = get_object_or_404(Recipe, pk=pk)
         object = model.objects.filter(user=user, recipe=recipe)
 
         if request.method == 'POST':
@@ -213,13 +403,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            model.objects.create(recipe=recipe, user=user)
+            with transaction.atomic():
+                model.objects.create(recipe=recipe, user=user)
+                if model is ShoppingCartItem:
+                    ShoppingListItem.objects.add_recipe(user, recipe)
+
             serializer = ShortRecipeSerializer(recipe)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            deleted, _ = object.delete()
+            with transaction.atomic():
+                deleted, _ = object.delete()
+                if deleted and model is ShoppingCartItem:
+                    ShoppingListItem.objects.remove_recipe(user, recipe)
             if not deleted:
                 raise ValidationError('Recipe not in shopping cart')
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -17,3 +17,91 @@ MIN_COOKING_TIME = 1
 
 MAX_INGREDIENT_AMOUNT = 10000
 MIN_INGREDIENT_AMOUNT = 1
+
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_IMPORT_BATCH_SIZE = 1000
+INGREDIENT_INDEX_MAX_AGE = 300
+
+SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_INDEX_MAX_AGE = 300
+
+COUNT_CACHE_TIMEOUT = 60
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_MAX_AGE = 60
+
+RECIPE_CACHE_TIMEOUT = 10 * 60
+RECIPE_MAX_AGE = 10
+
+USER_SETS_CACHE_TIMEOUT = 10 * 60
+
+SHORT_URL_CACHE_TIMEOUT = 24 * 60 * 60
+SHORT_URL_NEGATIVE_CACHE_TIMEOUT = 60
+SHORT_URL_LRU_SIZE = 10000
+# Other processes cannot evict the LRU when a recipe is deleted.
+SHORT_URL_LRU_TIMEOUT = 60
+SHORT_URL_HASH_ATTEMPTS = 10
+# Shorter than SHORT_URL_MAX_LENGTH random hashes of older recipes,
+# so deterministic codes never collide with them.
+SHORT_URL_CODE_LENGTH = 7
+
+# Renditions are scaled to fit in these boxes, keeping the aspect ratio.
+IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True,
+             'progressive': True},
+}
+IMAGE_WORKERS = 2
+# Whether the renditions of an image are written, cached by image name.
+RENDITIONS_MARKER_TIMEOUT = 24 * 60 * 60
+RENDITIONS_MISSING_MARKER_TIMEOUT = 60
+
+IMAGE_UPLOAD_FORMATS = {
+    'png': 'PNG',
+    'jpeg': 'JPEG',
+    'jpg': 'JPEG',
+    'gif': 'GIF',
+    'webp': 'WEBP',
+}
+# nginx accepts request bodies up to 10 MB.
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 5000 * 5000
+# A multiple of 4, so every chunk decodes on its own.
+BASE64_CHUNK_SIZE = 64 * 1024
+
+# Layout of recipe exports: a directory or a tarball.
+RECIPE_EXPORT_FILE = 'recipes.ndjson'
+RECIPE_EXPORT_IMAGES_DIR = 'images'
+RECIPE_TRANSFER_BATCH_SIZE = 1000
+
+# Tokens are resolved from the process LRU for a few seconds only, as
+# other processes cannot evict it on logout or deactivation.
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_LRU_TIMEOUT = 5
+AUTH_TOKEN_LRU_SIZE = 10000
+
+INSTRUMENTATION_CONFIG_REFRESH = 5
+INSTRUMENTATION_SLOW_REQUEST_MS = 500
+INSTRUMENTATION_MAX_QUERIES = 20
+# Statements run more often than this within a request are reported.
+INSTRUMENTATION_DUPLICATE_QUERIES = 5
+INSTRUMENTATION_SLOWEST_STATEMENTS = 3
+
+# Upper bounds of the metrics histogram buckets.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                           5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+METRICS_SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+# How often a process writes its metrics to METRICS_DIR.
+METRICS_FLUSH_INTERVAL = 5
+
+PROFILING_HEADER = 'X-Profile'
+# Only the latest profiles are kept.
+PROFILING_MAX_FILES = 200
+PROFILING_TOP_FUNCTIONS = 50
@@ -1,3 +1,4 @@
+import math
 import random
 import string
 
@@ -7,3 +8,9 @@ def generate_random_filename(length=16):
     characters = string.ascii_letters + string.digits
     random_string = "".join(random.choice(characters) for _ in range(length))
     return random_string
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of values"""
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
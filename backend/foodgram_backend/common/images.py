@@ -0,0 +1,143 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .constants import (IMAGE_RENDITION_FORMATS, IMAGE_RENDITIONS,
+                        IMAGE_WORKERS, RENDITIONS_MARKER_TIMEOUT,
+                        RENDITIONS_MISSING_MARKER_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'renditions'
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='renditions')
+
+
+def get_rendition_name(name, rendition, extension):
+    """Storage name of a rendition of the image stored as ``name``."""
+    base = posixpath.splitext(name)[0]
+    return posixpath.join(RENDITIONS_DIR, base, f'{rendition}.{extension}')
+
+
+def get_marker_name(name):
+    # Written last, so its presence means the whole set is ready.
+    return get_rendition_name(
+        name, list(IMAGE_RENDITIONS)[-1], list(IMAGE_RENDITION_FORMATS)[-1])
+
+
+def get_marker_cache_key(name):
+    return f'renditions-ready:{name}'
+
+
+def renditions_ready(name, storage=default_storage):
+    """Whether the renditions of ``name`` are written.
+
+    Remembered in the shared cache, set when they are generated, so
+    serializing a page of images does not ask the storage for each one.
+    """
+    if not name:
+        return False
+    key = get_marker_cache_key(name)
+    ready = cache.get(key)
+    if ready is None:
+        ready = storage.exists(get_marker_name(name))
+        cache.set(key, ready, RENDITIONS_MARKER_TIMEOUT if ready
+                  else RENDITIONS_MISSING_MARKER_TIMEOUT)
+    return ready
+
+
+def get_rendition_urls(name, storage=default_storage):
+    """Rendition URLs by size and format, or None while not generated."""
+    if not renditions_ready(name, storage):
+        return None
+    return {
+        rendition: {
+            extension: storage.url(
+                get_rendition_name(name, rendition, extension))
+            for extension in IMAGE_RENDITION_FORMATS
+        }
+        for rendition in IMAGE_RENDITIONS
+    }
+
+
+def render(image, size, extension):
+    """Scaled copy of ``image`` encoded without any metadata."""
+    options = dict(IMAGE_RENDITION_FORMATS[extension])
+    image = image.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+
+    if options['format'] == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        if image.mode in ('RGBA', 'LA'):
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(name, storage=default_storage, force=False):
+    """Write all renditions of the stored image ``name``.
+
+    Returns False if they already exist and ``force`` is not set.
+    """
+    if not force and renditions_ready(name, storage):
+        return False
+
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB')
+
+        for rendition, size in IMAGE_RENDITIONS.items():
+            for extension in IMAGE_RENDITION_FORMATS:
+                rendition_name = get_rendition_name(
+                    name, rendition, extension)
+                if storage.exists(rendition_name):
+                    storage.delete(rendition_name)
+                storage.save(
+                    rendition_name,
+                    ContentFile(render(image, size, extension)))
+    cache.set(get_marker_cache_key(name), True, RENDITIONS_MARKER_TIMEOUT)
+    return True
+
+
+def delete_renditions(name, storage=default_storage):
+    cache.delete(get_marker_cache_key(name))
+    for rendition in IMAGE_RENDITIONS:
+        for extension in IMAGE_RENDITION_FORMATS:
+            rendition_name = get_rendition_name(name, rendition, extension)
+            if storage.exists(rendition_name):
+                storage.delete(rendition_name)
+
+
+def process_image(name, callback=None):
+    try:
+        if generate_renditions(name) and callback is not None:
+            callback()
+    except Exception:
+        logger.exception('Could not generate renditions of %s', name)
+
+
+def schedule_renditions(name, callback=None):
+    """Generate renditions of ``name`` in the worker pool.
+
+    Submitted once the current transaction commits; ``callback`` runs
+    after new renditions have been written.
+    """
+    if name:
+        transaction.on_commit(
+            lambda: executor.submit(process_image, name, callback))
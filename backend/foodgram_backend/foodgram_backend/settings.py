@@ -5,6 +5,7 @@ Generated by 'django-admin startproject' using Django 3.2.16.
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -87,6 +91,20 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'users.FGUser'
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -140,17 +158,44 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
 
-    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CachedCountPagination',
     'PAGE_SIZE': 6,
 }
 
+# Key of the permutation turning recipe ids into short link codes.
+# Changing it changes the codes of recipes created afterwards.
+SHORT_URL_KEY = os.getenv('SHORT_URL_KEY', 'foodgram-short-url')
+
+# Initial state of the request instrumentation; the instrumentation
+# management command switches it at runtime.
+INSTRUMENTATION_ENABLED = (
+    os.getenv('INSTRUMENTATION_ENABLED', 'False').lower() == 'true')
+# File holding the runtime changes of the instrumentation options for
+# all processes; without it they are kept in the cache, which has to be
+# shared then.
+INSTRUMENTATION_CONFIG_FILE = os.getenv('INSTRUMENTATION_CONFIG_FILE') or None
+
+# Directory shared by the worker processes for their metrics; without
+# it, /api/metrics/ shows the metrics of the process serving it.
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+# Lets Prometheus scrape /api/metrics/ with a bearer token.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Profiles of sampled requests and of staff requests with the X-Profile
+# header, listed at /admin/profiles/. Kept out of the source tree.
+PROFILING_DIR = os.getenv('PROFILING_DIR') or os.path.join(
+    tempfile.gettempdir(), 'foodgram-profiles')
+# Share of requests to profile, changeable at runtime with the
+# instrumentation command.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
@@ -3,9 +3,18 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.profiling import (profile_detail_view, profile_download_view,
+                           profile_list_view)
 from recipe.views import placeholder_view, redirect_from_short_url
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profile_list_view),
+         name='profiles'),
+    path('admin/profiles/<str:name>/',
+         admin.site.admin_view(profile_detail_view), name='profile-detail'),
+    path('admin/profiles/<str:name>/download/',
+         admin.site.admin_view(profile_download_view),
+         name='profile-download'),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
     path('s/<str:hash>/', redirect_from_short_url,
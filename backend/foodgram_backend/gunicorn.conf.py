@@ -0,0 +1,20 @@
+# Read by gunicorn from the working directory.
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
+
+
+def on_starting(server):
+    from api.metrics import registry
+    registry.clear()
+
+
+def worker_exit(server, worker):
+    # Counts since the last periodic flush.
+    from api.metrics import registry
+    registry.flush(force=True)
+
+
+def child_exit(server, worker):
+    from api.metrics import registry
+    registry.mark_process_dead(worker.pid)
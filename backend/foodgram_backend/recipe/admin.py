@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     RecipeShortURL, ShoppingCartItem, Tag)
+                     RecipeShortURL, ShoppingCartItem, ShoppingListItem, Tag)
 
 RecipeTag = Recipe.tags.through
 
@@ -77,10 +77,15 @@ class ShoppingCartItemAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'user')
 
 
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount')
+
+
 admin.site.register(Tag)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeShortURL, RecipeShortURLAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(ShoppingCartItem, ShoppingCartItemAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
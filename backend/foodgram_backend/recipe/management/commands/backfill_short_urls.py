@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipe.models import Recipe, RecipeShortURL
+from recipe.short_urls import get_new_hashes
+
+
+class Command(BaseCommand):
+    help = 'Create short links for recipes that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.filter(
+            recipeshorturl__isnull=True).values_list('pk', flat=True))
+        batch_size = options['batch_size']
+
+        created = 0
+        for start in range(0, len(recipe_ids), batch_size):
+            hashes = get_new_hashes(recipe_ids[start:start + batch_size])
+            created += len(RecipeShortURL.objects.bulk_create(
+                RecipeShortURL(recipe_id=recipe_id, hash=hash)
+                for recipe_id, hash in hashes.items()
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Short links created: {created}'))
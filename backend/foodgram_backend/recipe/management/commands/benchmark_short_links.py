@@ -0,0 +1,62 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from common.help_functions import percentile
+from recipe.models import RecipeShortURL
+from recipe.short_urls import forget_short_url
+from recipe.views import redirect_from_short_url
+
+
+class Command(BaseCommand):
+    help = 'Measure short link redirects on a cold and a warm cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--links', type=int, default=100)
+
+    def handle(self, *args, **options):
+        hashes = list(RecipeShortURL.objects.values_list(
+            'hash', flat=True)[:options['links']])
+        if not hashes:
+            raise CommandError('There are no short links to resolve')
+
+        factory = RequestFactory()
+
+        def resolve(index):
+            hash = hashes[index % len(hashes)]
+            started = time.perf_counter()
+            response = redirect_from_short_url(
+                factory.get(f'/s/{hash}/'), hash)
+            assert response.status_code == 302
+            return (time.perf_counter() - started) * 1000
+
+        for hash in hashes:
+            forget_short_url(hash)
+
+        with CaptureQueriesContext(connection) as cold:
+            for index in range(len(hashes)):
+                resolve(index)
+        with CaptureQueriesContext(connection) as warm:
+            for index in range(len(hashes)):
+                resolve(index)
+        self.stdout.write(
+            f'queries per redirect: cold {len(cold) / len(hashes):.2f}, '
+            f'warm {len(warm) / len(hashes):.2f}')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            timings = list(executor.map(resolve, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{len(timings)} warm redirects in {options["threads"]} threads: '
+            f'{len(timings) / elapsed:.0f} req/s, '
+            f'p50 {statistics.median(timings):.3f} ms, '
+            f'p95 {percentile(timings, 95):.3f} ms')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Compare aggregated shopping lists with shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', nargs='*', type=int, dest='user_ids',
+                            help='ids of users whose lists are checked')
+        parser.add_argument('--fix', action='store_true',
+                            help='rebuild lists of inconsistent users')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        stored = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+
+        expected = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.calculate(user_ids).iterator()
+        }
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in stored.values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator()
+        }
+
+        broken_users = set()
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                user_id, ingredient_id = key
+                broken_users.add(user_id)
+                self.stdout.write(
+                    f'user {user_id}, ingredient {ingredient_id}: '
+                    f'expected {expected.get(key)}, '
+                    f'stored {actual.get(key)}')
+
+        if not broken_users:
+            self.stdout.write(self.style.SUCCESS('Shopping lists consistent'))
+            return
+
+        if options['fix']:
+            ShoppingListItem.objects.rebuild(broken_users)
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt shopping lists of {len(broken_users)} users'))
+            return
+
+        raise CommandError(
+            f'Shopping lists of {len(broken_users)} users are inconsistent')
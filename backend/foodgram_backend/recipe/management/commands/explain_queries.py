@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipe.query_plans import disable_seqscan, get_plan_checks
+
+
+class Command(BaseCommand):
+    help = 'Check that the main queries are planned with their indexes'
+
+    def handle(self, *args, **options):
+        failed = []
+
+        with transaction.atomic():
+            disable_seqscan()
+
+            for title, queryset, index in get_plan_checks():
+                if index is None:
+                    self.stdout.write(
+                        f'{title}: skipped, no index on {connection.vendor}')
+                    continue
+
+                plan = queryset.explain()
+                if index in plan:
+                    self.stdout.write(f'{title}: uses {index}')
+                else:
+                    failed.append(title)
+                    self.stdout.write(
+                        f'{title}: {index} not used\n{plan}')
+
+        if failed:
+            raise CommandError(
+                f'Queries not using their indexes: {", ".join(failed)}')
+
+        self.stdout.write(self.style.SUCCESS('All queries use indexes'))
@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from common.constants import (RECIPE_EXPORT_FILE, RECIPE_EXPORT_IMAGES_DIR,
+                              RECIPE_TRANSFER_BATCH_SIZE)
+from recipe.models import Recipe, RecipeIngredient
+
+TARBALL_MODES = {
+    '.tar': 'w',
+    '.gz': 'w:gz',
+    '.tgz': 'w:gz',
+}
+
+
+class Command(BaseCommand):
+    help = ('Export recipes with their tags, ingredients, short links and '
+            'images to a directory or a tarball')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str,
+                            help='directory, or a .tar, .tar.gz or .tgz file')
+        parser.add_argument('--batch-size', type=int,
+                            default=RECIPE_TRANSFER_BATCH_SIZE)
+        parser.add_argument('--no-images', action='store_true')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        self.with_images = not options['no_images']
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+
+        mode = TARBALL_MODES.get(os.path.splitext(output)[1])
+        try:
+            if mode is None:
+                exported = self.export_to_directory(output)
+            else:
+                exported = self.export_to_tarball(output, mode)
+        except OSError as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {exported} recipes to {output}'))
+
+    def export_to_directory(self, output):
+        os.makedirs(os.path.join(output, RECIPE_EXPORT_IMAGES_DIR),
+                    exist_ok=True)
+
+        def add_image(archive_name, source):
+            path = os.path.join(output, archive_name)
+            with open(path, 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+
+        with open(os.path.join(output, RECIPE_EXPORT_FILE), 'w',
+                  encoding='utf-8') as recipes_file:
+            return self.export(recipes_file, add_image)
+
+    def export_to_tarball(self, output, mode):
+        with tarfile.open(output, mode) as tarball:
+
+            def add_image(archive_name, source):
+                info = tarfile.TarInfo(archive_name)
+                info.size = source.size
+                tarball.addfile(info, source)
+
+            # Recipes go after the images, so an import can read the
+            # tarball as a stream with every image already stored.
+            with tempfile.TemporaryFile('w+', encoding='utf-8') as temp:
+                exported = self.export(temp, add_image)
+                temp.flush()
+                info = tarfile.TarInfo(RECIPE_EXPORT_FILE)
+                info.size = temp.buffer.tell()
+                temp.buffer.seek(0)
+                tarball.addfile(info, temp.buffer)
+        return exported
+
+    def export(self, recipes_file, add_image):
+        # Recipes may share an image, which is exported once.
+        self.exported_images = set()
+        exported = 0
+        for recipe in self.iterate_recipes():
+            record = self.serialize(recipe)
+            if self.with_images and recipe.image:
+                record['image'] = self.export_image(recipe, add_image)
+            recipes_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            exported += 1
+
+            if self.verbosity and exported % self.batch_size == 0:
+                self.stdout.write(f'{exported} recipes exported')
+        return exported
+
+    def iterate_recipes(self):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('recipeingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+            'recipeshorturl_set',
+        ).defer('search_vector').order_by('pk')
+
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:self.batch_size])
+            if not batch:
+                return
+            yield from batch
+            last_pk = batch[-1].pk
+
+    def serialize(self, recipe):
+        return {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'author': recipe.author.email,
+            'image': None,
+            'tags': [{'name': tag.name, 'slug': tag.slug}
+                     for tag in recipe.tags.all()],
+            'ingredients': [
+                {'name': recipe_ingredient.ingredient.name,
+                 'measurement_unit':
+                     recipe_ingredient.ingredient.measurement_unit,
+                 'amount': recipe_ingredient.amount}
+                for recipe_ingredient in recipe.recipeingredients.all()
+            ],
+            'short_links': [short_url.hash
+                            for short_url in recipe.recipeshorturl_set.all()],
+        }
+
+    def export_image(self, recipe, add_image):
+        archive_name = '/'.join(
+            (RECIPE_EXPORT_IMAGES_DIR, os.path.basename(recipe.image.name)))
+        if archive_name in self.exported_images:
+            return archive_name
+        try:
+            with default_storage.open(recipe.image.name, 'rb') as source:
+                add_image(archive_name, source)
+        except OSError as error:
+            self.stderr.write(f'Recipe {recipe.pk}: image skipped, {error}')
+            return None
+        self.exported_images.add(archive_name)
+        return archive_name
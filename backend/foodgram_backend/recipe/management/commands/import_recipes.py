@@ -0,0 +1,291 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from api.caching import bump_cache_version
+from common.constants import (RECIPE_EXPORT_FILE, RECIPE_EXPORT_IMAGES_DIR,
+                              RECIPE_TRANSFER_BATCH_SIZE)
+from recipe.models import (Ingredient, Recipe, RecipeIngredient,
+                           RecipeShortURL, Tag)
+from recipe.search import update_search_vectors
+from recipe.short_urls import get_new_hashes
+
+User = get_user_model()
+
+IMAGE_UPLOAD_DIR = Recipe._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = ('Import recipes exported by export_recipes, keeping their '
+            'publication dates and short links')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', type=str,
+                            help='export directory or tarball')
+        parser.add_argument('--author', type=str,
+                            help='email of the author for recipes whose '
+                                 'author does not exist')
+        parser.add_argument('--batch-size', type=int,
+                            default=RECIPE_TRANSFER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        self.default_author_id = None
+        if options['author']:
+            self.default_author_id = User.objects.filter(
+                email=options['author']).values_list('pk', flat=True).first()
+            if self.default_author_id is None:
+                raise CommandError(f'User {options["author"]} does not exist')
+
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit')
+        }
+        self.imported = self.skipped = self.links_changed = 0
+        self.started = time.perf_counter()
+
+        try:
+            if os.path.isdir(options['input']):
+                self.import_directory(options['input'])
+            else:
+                self.import_tarball(options['input'])
+        except (OSError, tarfile.TarError) as error:
+            raise CommandError(error)
+
+        if self.imported:
+            bump_cache_version('recipes')
+            bump_cache_version('counts')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} recipes, {self.skipped} skipped, '
+            f'{self.links_changed} short links already taken and replaced'))
+
+    def import_directory(self, directory):
+        with open(os.path.join(directory, RECIPE_EXPORT_FILE),
+                  encoding='utf-8') as recipes_file:
+            self.import_records(recipes_file, directory)
+
+    def import_tarball(self, path):
+        # Exports store the images before the recipes, so the tarball is
+        # read as a stream, once. Images wait in a temporary directory
+        # until a recipe using them is imported.
+        with tempfile.TemporaryDirectory() as directory, \
+                tarfile.open(path, 'r|*') as tarball:
+            os.makedirs(os.path.join(directory, RECIPE_EXPORT_IMAGES_DIR))
+            for member in tarball:
+                if (member.isfile() and member.name.startswith(
+                        RECIPE_EXPORT_IMAGES_DIR + '/')):
+                    with open(self.get_image_path(directory, member.name),
+                              'wb') as image:
+                        shutil.copyfileobj(tarball.extractfile(member), image)
+                elif member.name == RECIPE_EXPORT_FILE:
+                    self.import_records(
+                        (line.decode('utf-8')
+                         for line in tarball.extractfile(member)),
+                        directory)
+
+    def get_image_path(self, directory, archive_name):
+        # Only the name counts, archives cannot point outside the images.
+        return os.path.join(directory, RECIPE_EXPORT_IMAGES_DIR,
+                            os.path.basename(archive_name))
+
+    def store_image(self, archive_name):
+        """Stores an image of the export once, returns its name in the
+        storage or None if the export lacks it."""
+        if archive_name not in self.stored_images:
+            try:
+                image = open(
+                    self.get_image_path(self.directory, archive_name), 'rb')
+            except FileNotFoundError:
+                self.stored_images[archive_name] = None
+            else:
+                with image:
+                    self.stored_images[archive_name] = default_storage.save(
+                        f'{IMAGE_UPLOAD_DIR}/'
+                        f'{os.path.basename(archive_name)}',
+                        File(image))
+        return self.stored_images[archive_name]
+
+    def import_records(self, lines, directory):
+        self.directory = directory
+        self.stored_images = {}
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                batch.append(self.build_recipe(record))
+            except (KeyError, TypeError, ValueError) as error:
+                self.skipped += 1
+                self.stderr.write(f'Line {number} skipped: {error!r}')
+                continue
+
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+
+        if batch:
+            self.import_batch(batch)
+
+    def build_recipe(self, record):
+        recipe = Recipe(
+            name=record['name'],
+            text=record['text'],
+            cooking_time=int(record['cooking_time']),
+        )
+        recipe.pub_date = parse_datetime(record['pub_date'])
+        if recipe.pub_date is None:
+            raise ValueError(f'Invalid pub_date {record["pub_date"]!r}')
+        record['tags'] = [
+            {'name': str(tag['name']), 'slug': str(tag['slug'])}
+            for tag in record['tags']
+        ]
+        record['ingredients'] = [
+            {'name': str(ingredient['name']),
+             'measurement_unit': str(ingredient['measurement_unit']),
+             'amount': int(ingredient['amount'])}
+            for ingredient in record['ingredients']
+        ]
+        record['image'] = str(record.get('image') or '')
+        return recipe, record
+
+    def import_batch(self, batch):
+        authors = dict(User.objects.filter(
+            email__in={record['author'] for _, record in batch}
+        ).values_list('email', 'pk'))
+
+        recipes = []
+        for recipe, record in batch:
+            recipe.author_id = authors.get(
+                record['author'], self.default_author_id)
+            if recipe.author_id is None:
+                self.skipped += 1
+                self.stderr.write(
+                    f'Recipe {record["name"]!r} skipped: '
+                    f'author {record["author"]} does not exist')
+                continue
+            # Images are stored only for recipes that are imported.
+            if record['image']:
+                image = self.store_image(record['image'])
+                if image is None:
+                    self.skipped += 1
+                    self.stderr.write(
+                        f'Recipe {record["name"]!r} skipped: '
+                        f'image {record["image"]} is missing')
+                    continue
+                recipe.image = image
+            recipes.append((recipe, record))
+        if not recipes:
+            return
+
+        with transaction.atomic():
+            self.create_recipes([recipe for recipe, _ in recipes])
+            self.create_relations(recipes)
+        update_search_vectors([recipe.pk for recipe, _ in recipes])
+
+        self.imported += len(recipes)
+        if self.verbosity:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write(
+                f'{self.imported} recipes imported, '
+                f'{self.imported / elapsed:.0f} recipes/s')
+
+    def create_recipes(self, recipes):
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+
+        # pub_date is auto_now_add, so it is overwritten on insert.
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+
+    def create_relations(self, recipes):
+        self.create_missing_tags(recipes)
+        self.create_missing_ingredients(recipes)
+
+        RecipeTag = Recipe.tags.through
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipe.pk, tag_id=self.tags[tag['slug']])
+            for recipe, record in recipes
+            for tag in record['tags']
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.pk,
+                ingredient_id=self.ingredients[
+                    ingredient['name'], ingredient['measurement_unit']],
+                amount=ingredient['amount'])
+            for recipe, record in recipes
+            for ingredient in record['ingredients']
+        )
+        self.create_short_links(recipes)
+
+    def create_missing_tags(self, recipes):
+        for _, record in recipes:
+            for tag in record['tags']:
+                if tag['slug'] not in self.tags:
+                    self.tags[tag['slug']] = Tag.objects.get_or_create(
+                        slug=tag['slug'], defaults={'name': tag['name']}
+                    )[0].pk
+
+    def create_missing_ingredients(self, recipes):
+        missing = {
+            (ingredient['name'], ingredient['measurement_unit'])
+            for _, record in recipes
+            for ingredient in record['ingredients']
+        } - self.ingredients.keys()
+        if not missing:
+            return
+
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in missing),
+            ignore_conflicts=True)
+        bump_cache_version('ingredients')
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+                name__in={name for name, _ in missing}).values_list(
+                    'pk', 'name', 'measurement_unit'):
+            self.ingredients[name, measurement_unit] = pk
+
+    def create_short_links(self, recipes):
+        hashes = {hash for _, record in recipes
+                  for hash in record.get('short_links', ())}
+        taken = set(RecipeShortURL.objects.filter(
+            hash__in=hashes).values_list('hash', flat=True))
+
+        short_urls = []
+        without_links = []
+        for recipe, record in recipes:
+            links = [hash for hash in record.get('short_links', ())
+                     if hash not in taken]
+            self.links_changed += len(record.get('short_links', ())) - len(
+                links)
+            taken.update(links)
+            short_urls += [RecipeShortURL(recipe_id=recipe.pk, hash=hash)
+                           for hash in links]
+            if not links:
+                without_links.append(recipe.pk)
+
+        short_urls += [
+            RecipeShortURL(recipe_id=recipe_id, hash=hash)
+            for recipe_id, hash in get_new_hashes(without_links).items()
+        ]
+        RecipeShortURL.objects.bulk_create(short_urls)
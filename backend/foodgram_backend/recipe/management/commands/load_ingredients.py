@@ -1,36 +1,157 @@
 import csv
+import json
+import os
+import time
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.caching import bump_cache_version
+from common.constants import (INGR_NAME_MAX_LENGTH, INGR_UNIT_MAX_LENGTH,
+                              INGREDIENT_IMPORT_BATCH_SIZE)
 from recipe.models import Ingredient
 
-PROJECT_DIR = str(settings.BASE_DIR) + '/'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield None
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    """Yields objects of a JSON array (or a stream of objects) one by one."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n[],')
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield ((item.get('name'), item.get('measurement_unit'))
+                       if isinstance(item, dict) else None)
+                continue
+        elif eof:
+            return
+
+        chunk = file.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
-    help = 'Import prepared csv-file with ingredients'
+    help = 'Import ingredients from csv- or json-files, skipping known ones'
 
     def add_arguments(self, parser):
-        parser.add_argument('input_file', nargs='*', type=str,
-                            help='csv-filename with path')
+        parser.add_argument('input_file', nargs='+', type=str,
+                            help='csv- or json-filename with path')
+        parser.add_argument('--format', choices=READERS,
+                            help='file format, by extension if not given')
+        parser.add_argument('--batch-size', type=int,
+                            default=INGREDIENT_IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='list ingredients that would be added')
 
     def handle(self, *args, **options):
         foodgram_dir = str(settings.BASE_DIR).rsplit('/', 2)[0] + '/'
-        input_file = foodgram_dir + options['input_file'][0]
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.processed = self.new = self.skipped = 0
+        self.started = time.perf_counter()
+
+        count = Ingredient.objects.count()
+        with transaction.atomic():
+            for input_file in options['input_file']:
+                path = os.path.join(foodgram_dir, input_file)
+                file_format = (options['format']
+                               or os.path.splitext(path)[1].lstrip('.'))
+                if file_format not in READERS:
+                    raise CommandError(f'Unknown format of {input_file}')
+
+                self.stdout.write(f'Importing {input_file}')
+                try:
+                    with open(path, mode='r', encoding='utf-8') as file:
+                        self.import_rows(
+                            READERS[file_format](file), options['batch_size'])
+                except (OSError, ValueError) as error:
+                    raise CommandError(f'{input_file}: {error}')
+
+        if self.dry_run:
+            added = self.new
+        else:
+            # Rows inserted concurrently are dropped by bulk_create.
+            added = Ingredient.objects.count() - count
+        if added and not self.dry_run:
+            bump_cache_version('ingredients')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would add" if self.dry_run else "Added"} {added} '
+            f'of {self.processed} ingredients, {self.skipped} rows skipped'))
+
+    def import_rows(self, rows, batch_size):
+        seen = set()
+        batch = []
+        for number, row in enumerate(rows, 1):
+            key = self.clean_row(number, row)
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            batch.append(key)
+
+            if len(batch) >= batch_size:
+                self.import_batch(batch)
+                batch = []
+
+        if batch:
+            self.import_batch(batch)
+
+    def clean_row(self, number, row):
+        self.processed += 1
+        if row is not None and all(isinstance(value, str) for value in row):
+            name, measurement_unit = (value.strip() for value in row)
+            if (name and measurement_unit
+                    and len(name) <= INGR_NAME_MAX_LENGTH
+                    and len(measurement_unit) <= INGR_UNIT_MAX_LENGTH):
+                return name, measurement_unit
 
-        with open(input_file, mode='r', encoding='utf-8') as csvfile:
-            csvreader = csv.reader(csvfile)
+        self.skipped += 1
+        self.stderr.write(f'Row {number} skipped: {row!r}')
+        return None
 
-            ingredients = []
-            for row in csvreader:
-                name = row[0].strip()
-                measurement_unit = row[1].strip()
+    def import_batch(self, batch):
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        new = [key for key in batch if key not in existing]
 
-                ingredient = Ingredient(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
-                ingredients.append(ingredient)
+        if self.dry_run:
+            for name, measurement_unit in new:
+                self.stdout.write(f'+ {name}, {measurement_unit}')
+        else:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in new),
+                ignore_conflicts=True)
+        self.new += len(new)
 
-            Ingredient.objects.bulk_create(ingredients)
+        if self.verbosity:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write(
+                f'{self.processed} rows, {self.new} new, '
+                f'{self.processed / elapsed:.0f} rows/s')
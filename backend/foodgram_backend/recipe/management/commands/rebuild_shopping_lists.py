@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipe.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuild aggregated shopping lists from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', nargs='*', type=int, dest='user_ids',
+                            help='ids of users whose lists are rebuilt')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ShoppingListItem.objects.rebuild(
+            options['user_ids'], batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping lists rebuilt: '
+            f'{ShoppingListItem.objects.count()} items'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipe.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute recipe search vectors, e.g. after ingredient renames'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipe', nargs='*', type=int, dest='recipe_ids',
+                            help='ids of recipes to update')
+
+    def handle(self, *args, **options):
+        update_search_vectors(options['recipe_ids'])
+        self.stdout.write(self.style.SUCCESS('Search vectors updated'))
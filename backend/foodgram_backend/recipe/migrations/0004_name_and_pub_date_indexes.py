@@ -0,0 +1,74 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:41
+
+from django.db import DatabaseError, migrations, models, transaction
+
+# Indexes Django 3.2 cannot declare on a model: an upper-cased pattern
+# index serving istartswith lookups and trigram indexes serving
+# icontains lookups. They are created on PostgreSQL only, the trigram
+# ones only where the pg_trgm extension is installed or can be created
+# by the migrating role; without it substring searches scan the tables.
+POSTGRES_INDEXES = (
+    ('ingredient_name_upper_idx', 'recipe_ingredient',
+     'btree (UPPER("name"::text) text_pattern_ops)'),
+)
+TRIGRAM_INDEXES = (
+    ('ingredient_name_trgm_idx', 'recipe_ingredient',
+     'gin ("name" gin_trgm_ops)'),
+    ('recipe_name_trgm_idx', 'recipe_recipe',
+     'gin ("name" gin_trgm_ops)'),
+)
+
+
+def create_trigram_extension(schema_editor):
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    indexes = POSTGRES_INDEXES
+    if create_trigram_extension(schema_editor):
+        indexes += TRIGRAM_INDEXES
+    for name, table, definition in indexes:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+            f'USING {definition}')
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in POSTGRES_INDEXES + TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['name'], name='recipe_name_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:43
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# A copy of recipe.search.UPDATE_SEARCH_VECTOR_SQL as it was when this
+# migration was written; later changes to it must not change this one.
+UPDATE_SEARCH_VECTOR_SQL = '''
+    UPDATE recipe_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, recipe.name), 'A')
+        || setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipe_recipeingredient AS amount
+            JOIN recipe_ingredient AS ingredient
+                ON ingredient.id = amount.ingredient_id
+            WHERE amount.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s, recipe.text), 'C')
+'''
+SEARCH_CONFIG = 'russian'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS "recipe_search_vector_idx" '
+        'ON "recipe_recipe" USING gin ("search_vector")')
+    schema_editor.execute(UPDATE_SEARCH_VECTOR_SQL,
+                          {'config': SEARCH_CONFIG})
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS "recipe_search_vector_idx"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_name_and_pub_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:48
+
+from django.db import migrations
+
+from common.help_functions import generate_random_filename
+
+
+def deduplicate_hashes(apps, schema_editor):
+    RecipeShortURL = apps.get_model('recipe', 'RecipeShortURL')
+
+    taken = set(RecipeShortURL.objects.values_list('hash', flat=True))
+    seen = set()
+    for short_url in RecipeShortURL.objects.order_by('pk').iterator():
+        if short_url.hash and short_url.hash not in seen:
+            seen.add(short_url.hash)
+            continue
+
+        new_hash = generate_random_filename(length=8)
+        while new_hash in taken:
+            new_hash = generate_random_filename(length=8)
+
+        short_url.hash = new_hash
+        short_url.save(update_fields=['hash'])
+        taken.add(new_hash)
+        seen.add(new_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0005_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_deduplicate_short_url_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipeshorturl',
+            name='hash',
+            field=models.CharField(max_length=8, unique=True, verbose_name='Хеш'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:52
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+
+    duplicated = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(kept_id=Min('pk'), rows=Count('pk')).filter(rows__gt=1)
+
+    for group in duplicated.iterator():
+        kept_id = group['kept_id']
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=kept_id).values_list('pk', flat=True))
+
+        for model, owner, amount in (
+                (RecipeIngredient, 'recipe_id', 'amount'),
+                (ShoppingListItem, 'user_id', 'total_amount')):
+            for item in model.objects.filter(
+                    ingredient_id__in=duplicate_ids).order_by('pk'):
+                kept = model.objects.filter(
+                    ingredient_id=kept_id,
+                    **{owner: getattr(item, owner)}).first()
+                if kept is None:
+                    item.ingredient_id = kept_id
+                    item.save(update_fields=['ingredient'])
+                else:
+                    setattr(kept, amount,
+                            getattr(kept, amount) + getattr(item, amount))
+                    kept.save(update_fields=[amount])
+                    item.delete()
+
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_unique_short_url_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+    ]
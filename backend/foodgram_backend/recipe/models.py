@@ -1,13 +1,16 @@
+from itertools import islice
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Sum
 
 from common.constants import (INGR_NAME_MAX_LENGTH, INGR_UNIT_MAX_LENGTH,
                               MAX_COOKING_TIME, MAX_INGREDIENT_AMOUNT,
                               MIN_COOKING_TIME, MIN_INGREDIENT_AMOUNT,
                               RECIPE_NAME_MAX_LENGTH, SHORT_URL_MAX_LENGTH,
                               TAG_MAX_LENGTH)
-from common.help_functions import generate_random_filename
 from users.models import FGUser
 
 User = get_user_model()
@@ -22,6 +25,13 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(fields=['name'], name='ingredient_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
 
     def __str__(self):
         return self.name
@@ -67,12 +77,20 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации')
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый вектор')
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['name'], name='recipe_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -112,16 +130,12 @@ class RecipeShortURL(models.Model):
     recipe = models.ForeignKey(
         'Recipe', verbose_name='Рецепт', on_delete=models.CASCADE)
     hash = models.CharField(
-        max_length=SHORT_URL_MAX_LENGTH, verbose_name='Хеш')
+        max_length=SHORT_URL_MAX_LENGTH, unique=True, verbose_name='Хеш')
 
     class Meta:
         verbose_name = 'Короткая ссылка'
         verbose_name_plural = 'Короткие ссылки'
 
-    def generate_hash(self):
-        self.hash = generate_random_filename(length=8)
-        self.save()
-
 
 class Favorite(models.Model):
     recipe = models.ForeignKey(
@@ -158,3 +172,130 @@ class ShoppingCartItem(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_recipe_in_users_cart'),
         ]
+
+
+# Adds the (user_id, ingredient_id, amount) rows of a SELECT to the lists.
+ADD_AMOUNTS_SQL = """
+    INSERT INTO {table} (user_id, ingredient_id, total_amount)
+    {select}
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET total_amount = {table}.total_amount + EXCLUDED.total_amount
+"""
+
+
+class ShoppingListItemManager(models.Manager):
+    def add_amounts(self, select, params):
+        """Adds amounts to the lists in one statement.
+
+        ``select`` returns (user_id, ingredient_id, amount) rows. Missing
+        items are inserted and present ones changed in place, so concurrent
+        changes of an item wait for its row lock instead of failing on the
+        unique constraint; ``select`` orders its rows, so everyone locks
+        them in the same order.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(ADD_AMOUNTS_SQL.format(
+                table=self.model._meta.db_table, select=select), params)
+
+    def add_recipe(self, user, recipe, sign=1):
+        self.add_amounts(
+            f'SELECT %s, ingredient_id, %s * amount '
+            f'FROM {RecipeIngredient._meta.db_table} '
+            f'WHERE recipe_id = %s ORDER BY ingredient_id',
+            [user.pk, sign, recipe.pk])
+
+    def remove_recipe(self, user, recipe):
+        with transaction.atomic(savepoint=False):
+            self.add_recipe(user, recipe, sign=-1)
+            self.filter(user=user, total_amount__lte=0).delete()
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Applies a change of recipe ingredients to every cart holding it.
+
+        Saved and deleted recipe ingredients are applied by the signals in
+        ``recipe.signals``; this is for bulk changes, which send none.
+        """
+        changes = []
+        for ingredient_id in sorted(old_amounts.keys() | new_amounts.keys()):
+            delta = (new_amounts.get(ingredient_id, 0)
+                     - old_amounts.get(ingredient_id, 0))
+            if delta:
+                changes.append((ingredient_id, delta))
+        if not changes:
+            return
+
+        values = ', '.join(['(%s, %s)'] * len(changes))
+        with transaction.atomic(savepoint=False):
+            self.add_amounts(
+                f'SELECT user_id, changes.column1, changes.column2 '
+                f'FROM {ShoppingCartItem._meta.db_table} '
+                f'CROSS JOIN (VALUES {values}) AS changes '
+                f'WHERE recipe_id = %s ORDER BY user_id, changes.column1',
+                [value for change in changes for value in change]
+                + [recipe_id])
+            if any(delta < 0 for _, delta in changes):
+                self.filter(
+                    user__in=ShoppingCartItem.objects.filter(
+                        recipe_id=recipe_id).values('user_id'),
+                    total_amount__lte=0
+                ).delete()
+
+    def calculate(self, user_ids=None):
+        """Aggregates the lists from shopping carts, bypassing the table."""
+        ingredients = RecipeIngredient.objects.values(
+            user_id=F('recipe__shopping_cart_items__user_id'))
+
+        if user_ids is None:
+            ingredients = ingredients.filter(user_id__isnull=False)
+        else:
+            ingredients = ingredients.filter(user_id__in=user_ids)
+
+        return ingredients.annotate(
+            total_amount=Sum('amount')
+        ).values_list('user_id', 'ingredient_id', 'total_amount')
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        with transaction.atomic():
+            items = self.all()
+            if user_ids is not None:
+                items = items.filter(user_id__in=user_ids)
+            items.delete()
+
+            rows = self.calculate(user_ids).iterator()
+            while True:
+                batch = [
+                    self.model(user_id=user_id,
+                               ingredient_id=ingredient_id,
+                               total_amount=total_amount)
+                    for user_id, ingredient_id, total_amount
+                    in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                self.bulk_create(batch)
+
+
+class ShoppingListItem(models.Model):
+    """Ingredient totals of a user's shopping cart, kept up to date."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE
+    )
+    total_amount = models.IntegerField(verbose_name='Общее количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        default_related_name = 'shopping_list_items'
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_ingredient_in_users_list'),
+        ]
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import Ingredient, Recipe
+
+User = get_user_model()
+
+
+def get_index_names(*tables):
+    with connection.cursor() as cursor:
+        return {
+            name
+            for table in tables
+            for name in connection.introspection.get_constraints(
+                cursor, table)
+        }
+
+
+def get_plan_checks():
+    """Returns the main queries as (title, queryset, index) with the index
+    expected in their plans on this database, None where there is none."""
+    author = User.objects.order_by('pk').first()
+    author_id = author.pk if author else 0
+    vendor = connection.vendor
+    # Trigram indexes exist only where pg_trgm could be installed.
+    indexes = get_index_names(Ingredient._meta.db_table,
+                              Recipe._meta.db_table)
+
+    # (title, queryset, {vendor: index expected in the plan})
+    checks = (
+        ('recipe feed',
+         Recipe.objects.order_by('-pub_date')[:6],
+         {'postgresql': 'recipe_pub_date_idx',
+          'sqlite': 'recipe_pub_date_idx'}),
+        ('author recipes',
+         Recipe.objects.filter(author_id=author_id).order_by('-pub_date')[:6],
+         {'postgresql': 'recipe_author_pub_date_idx',
+          'sqlite': 'recipe_author_pub_date_idx'}),
+        ('ingredient prefix search',
+         Ingredient.objects.filter(name__istartswith='сол'),
+         {'postgresql': 'ingredient_name_upper_idx'}),
+        ('ingredient substring search',
+         Ingredient.objects.filter(name__icontains='сол'),
+         {'postgresql': 'ingredient_name_trgm_idx'}),
+        ('recipe substring search',
+         Recipe.objects.filter(name__icontains='суп'),
+         {'postgresql': 'recipe_name_trgm_idx'}),
+    )
+    return [
+        (title, queryset,
+         expected[vendor] if expected.get(vendor) in indexes else None)
+        for title, queryset, expected in checks
+    ]
+
+
+def disable_seqscan():
+    """Makes PostgreSQL plan with any usable index for the rest of the
+    transaction; small tables are cheaper to scan sequentially, the checks
+    are about whether an index is usable, not about row counts."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
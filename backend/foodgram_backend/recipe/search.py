@@ -0,0 +1,148 @@
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat, StrIndex
+
+from common.constants import RECIPE_SEARCH_INDEX_MAX_AGE, SEARCH_CONFIG
+
+from .models import Recipe, RecipeIngredient
+
+# Same weights as the tsvector built below: name (A), ingredients (B),
+# text (C), using PostgreSQL's default ts_rank weights.
+FIELD_WEIGHTS = (('name', 1.0), ('ingredients', 0.4), ('text', 0.2))
+
+UPDATE_SEARCH_VECTOR_SQL = '''
+    UPDATE recipe_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, recipe.name), 'A')
+        || setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipe_recipeingredient AS amount
+            JOIN recipe_ingredient AS ingredient
+                ON ingredient.id = amount.ingredient_id
+            WHERE amount.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s, recipe.text), 'C')
+'''
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class RecipeSearchIndex:
+    """Process-local inverted index used where PostgreSQL is unavailable.
+
+    Maps every token of recipe names, ingredient names and texts to the
+    weighted term frequencies of the recipes containing it. It is built
+    on first use and rebuilt after invalidation or ``max_age`` seconds.
+    """
+
+    def __init__(self, max_age=RECIPE_SEARCH_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._postings = None
+        self._pub_dates = {}
+        self._size = 0
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def _build(self):
+        documents = defaultdict(dict)
+        pub_dates = {}
+        for pk, name, text, pub_date in Recipe.objects.values_list(
+                'pk', 'name', 'text', 'pub_date').iterator():
+            documents[pk]['name'] = name
+            documents[pk]['text'] = text
+            pub_dates[pk] = pub_date
+        for pk, name in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient__name').iterator():
+            if pk not in pub_dates:
+                # Created after the recipes were read.
+                continue
+            documents[pk]['ingredients'] = (
+                documents[pk].get('ingredients', '') + ' ' + name)
+
+        postings = defaultdict(dict)
+        for pk, fields in documents.items():
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(fields.get(field, '')):
+                    postings[token][pk] = postings[token].get(pk, 0) + weight
+
+        self._postings = dict(postings)
+        self._pub_dates = pub_dates
+        self._size = len(documents)
+        self._built_at = time.monotonic()
+
+    def search(self, query):
+        """Returns (recipe id, score) pairs containing all query tokens,
+        best first, then newest first."""
+        with self._lock:
+            if (self._postings is None
+                    or time.monotonic() - self._built_at > self.max_age):
+                self._build()
+            postings, pub_dates = self._postings, self._pub_dates
+            size = self._size
+
+        scores = None
+        for token in set(tokenize(query)):
+            matches = postings.get(token, {})
+            idf = math.log(1 + size / (1 + len(matches)))
+            token_scores = {pk: tf * idf for pk, tf in matches.items()}
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: score + token_scores[pk]
+                          for pk, score in scores.items()
+                          if pk in token_scores}
+
+        return sorted((scores or {}).items(), reverse=True,
+                      key=lambda item: (item[1], pub_dates[item[0]],
+                                        item[0]))
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def update_search_vectors(recipe_ids=None):
+    """Recomputes search vectors of the given recipes, or of all of them."""
+    if connection.vendor != 'postgresql':
+        recipe_search_index.invalidate()
+        return
+
+    sql, params = UPDATE_SEARCH_VECTOR_SQL, {'config': SEARCH_CONFIG}
+    if recipe_ids is not None:
+        sql += ' WHERE recipe.id = ANY(%(ids)s)'
+        params['ids'] = list(recipe_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def search_recipes(queryset, query):
+    """Filters recipes matching ``query`` and orders them by rank."""
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date', '-pk')
+
+    # The ranked ids are sent as one string and recipes are ordered by
+    # their position in it, so the query does not grow with the matches.
+    ranked = recipe_search_index.search(query)
+    if not ranked:
+        return queryset.none()
+    ids = ','.join(str(pk) for pk, _ in ranked)
+    return queryset.annotate(
+        search_position=StrIndex(
+            Value(f',{ids},'),
+            Concat(Value(','), Cast('pk', CharField()), Value(',')))
+    ).filter(search_position__gt=0).order_by('search_position')
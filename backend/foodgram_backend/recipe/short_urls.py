@@ -0,0 +1,153 @@
+import secrets
+import string
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.constants import (SHORT_URL_CACHE_TIMEOUT, SHORT_URL_CODE_LENGTH,
+                              SHORT_URL_HASH_ATTEMPTS, SHORT_URL_LRU_SIZE,
+                              SHORT_URL_LRU_TIMEOUT, SHORT_URL_MAX_LENGTH,
+                              SHORT_URL_NEGATIVE_CACHE_TIMEOUT)
+from common.lru import LRUCache
+
+from .models import Recipe, RecipeShortURL
+
+# Stored in the shared cache for hashes that do not exist.
+MISSING = 0
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_SPACE = len(ALPHABET) ** SHORT_URL_CODE_LENGTH
+
+
+def get_permutation_keys():
+    # An affine map id * a + b modulo CODE_SPACE is a bijection when a is
+    # coprime with CODE_SPACE = 2^7 * 31^7, i.e. odd and not divisible by 31.
+    digest = sha256(settings.SHORT_URL_KEY.encode()).digest()
+    a = int.from_bytes(digest[:16], 'big') % CODE_SPACE | 1
+    if a % 31 == 0:
+        a = (a + 2) % CODE_SPACE
+    b = int.from_bytes(digest[16:], 'big') % CODE_SPACE
+    return a, b
+
+
+def encode_recipe_id(recipe_id):
+    """Returns the short code of a recipe, unique for every recipe id."""
+    if not 0 < recipe_id < CODE_SPACE:
+        raise ValueError(f'Recipe id {recipe_id} cannot be encoded')
+
+    a, b = get_permutation_keys()
+    number = (recipe_id * a + b) % CODE_SPACE
+
+    code = []
+    for _ in range(SHORT_URL_CODE_LENGTH):
+        number, digit = divmod(number, len(ALPHABET))
+        code.append(ALPHABET[digit])
+    return ''.join(reversed(code))
+
+
+def decode_recipe_id(code):
+    """Returns the recipe id a short code was made from, or None."""
+    if len(code) != SHORT_URL_CODE_LENGTH:
+        return None
+
+    number = 0
+    for char in code:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            return None
+        number = number * len(ALPHABET) + digit
+
+    a, b = get_permutation_keys()
+    return (number - b) * pow(a, -1, CODE_SPACE) % CODE_SPACE or None
+
+
+def generate_hash():
+    return ''.join(secrets.choice(ALPHABET)
+                   for _ in range(SHORT_URL_MAX_LENGTH))
+
+
+def get_new_hashes(recipe_ids):
+    """Returns {recipe id: hash} for new short links of the recipes.
+
+    The hash is the recipe code, unless a link imported from another
+    database already uses it; then a longer random hash is used, which
+    never collides with codes. Random hashes are retried until none of
+    them is stored or repeated in the batch.
+    """
+    hashes = {recipe_id: encode_recipe_id(recipe_id)
+              for recipe_id in recipe_ids}
+    candidates = set(hashes.values())
+
+    for _ in range(SHORT_URL_HASH_ATTEMPTS):
+        taken = set(RecipeShortURL.objects.filter(
+            hash__in=candidates).values_list('hash', flat=True))
+        if not taken:
+            return hashes
+
+        used = set(hashes.values())
+        candidates = set()
+        for recipe_id, hash in hashes.items():
+            if hash not in taken:
+                continue
+            while hash in used:
+                hash = generate_hash()
+            hashes[recipe_id] = hash
+            used.add(hash)
+            candidates.add(hash)
+
+    raise RuntimeError('No free short link hashes found')
+
+
+recipe_ids = LRUCache(SHORT_URL_LRU_SIZE, timeout=SHORT_URL_LRU_TIMEOUT)
+
+
+def get_cache_key(hash):
+    return f'short-url:{hash}'
+
+
+def resolve_short_url(hash):
+    """Returns the id of the recipe behind ``hash`` or None.
+
+    Looks in the process LRU, then in the shared cache, then in the
+    database, where the hash is either stored or decoded to a recipe id.
+    Unknown hashes are remembered in the shared cache for a short time,
+    so repeated misses do not reach the database either.
+    """
+    recipe_id = recipe_ids.get(hash)
+    if recipe_id is not None:
+        return recipe_id
+
+    key = get_cache_key(hash)
+    recipe_id = cache.get(key)
+
+    if recipe_id is None:
+        recipe_id = find_recipe_id(hash)
+        if recipe_id is None:
+            cache.set(key, MISSING, SHORT_URL_NEGATIVE_CACHE_TIMEOUT)
+            return None
+        cache.set(key, recipe_id, SHORT_URL_CACHE_TIMEOUT)
+
+    if recipe_id == MISSING:
+        return None
+
+    recipe_ids.set(hash, recipe_id)
+    return recipe_id
+
+
+def find_recipe_id(hash):
+    recipe_id = RecipeShortURL.objects.filter(
+        hash=hash).values_list('recipe_id', flat=True).first()
+    if recipe_id is not None:
+        return recipe_id
+
+    # Recipes without a stored link are still reachable by their code.
+    recipe_id = decode_recipe_id(hash)
+    if recipe_id is not None and Recipe.objects.filter(pk=recipe_id).exists():
+        return recipe_id
+    return None
+
+
+def forget_short_url(hash):
+    recipe_ids.delete(hash)
+    cache.delete(get_cache_key(hash))
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .models import Recipe, RecipeIngredient, RecipeShortURL, ShoppingListItem
+from .short_urls import encode_recipe_id, forget_short_url
+
+# Set while recipe ingredients are changed in bulk and the difference is
+# applied to the shopping lists at once, by the code changing them.
+ingredients_changed_in_bulk = ContextVar(
+    'ingredients_changed_in_bulk', default=False)
+
+
+@contextmanager
+def change_ingredients_in_bulk():
+    """Keeps the handlers below off the shopping lists."""
+    token = ingredients_changed_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        ingredients_changed_in_bulk.reset(token)
+
+
+@receiver((post_save, post_delete), sender=RecipeShortURL)
+def invalidate_short_url(sender, instance, **kwargs):
+    forget_short_url(instance.hash)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_code(sender, instance, **kwargs):
+    # Stored links go through the handler above as they are cascaded;
+    # the code resolves without one.
+    forget_short_url(encode_recipe_id(instance.pk))
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    instance.old_amounts = {}
+    if not raw and instance.pk is not None:
+        instance.old_amounts = dict(RecipeIngredient.objects.filter(
+            pk=instance.pk).values_list('ingredient_id', 'amount'))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    # Recipe ingredients edited in the admin or the shell reach the
+    # shopping lists of the carts holding the recipe.
+    if raw or ingredients_changed_in_bulk.get():
+        return
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, instance.old_amounts,
+        {instance.ingredient_id: instance.amount})
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def remove_recipe_ingredient(sender, instance, **kwargs):
+    # Sent before anything is deleted, so the carts of a deleted recipe
+    # still hold it.
+    if ingredients_changed_in_bulk.get():
+        return
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
@@ -0,0 +1,275 @@
+import json
+import os
+import tarfile
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from common.constants import RECIPE_EXPORT_FILE, SHORT_URL_MAX_LENGTH
+
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeShortURL,
+                     ShoppingCartItem, ShoppingListItem)
+from .query_plans import disable_seqscan, get_plan_checks
+from .short_urls import encode_recipe_id, get_new_hashes
+
+User = get_user_model()
+
+
+class ShoppingListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия', password='password')
+            for number in range(2)
+        ]
+        cls.flour, cls.milk, cls.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко', 'яйца'))
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=self.users[0], name='Блины', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png')
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=self.recipe, ingredient=self.flour,
+                             amount=200),
+            RecipeIngredient(recipe=self.recipe, ingredient=self.milk,
+                             amount=500),
+        ])
+        for user in self.users:
+            ShoppingCartItem.objects.create(user=user, recipe=self.recipe)
+            ShoppingListItem.objects.add_recipe(user, self.recipe)
+
+    def assert_lists(self, amounts):
+        for user in self.users:
+            self.assertEqual(
+                dict(ShoppingListItem.objects.filter(user=user).values_list(
+                    'ingredient__name', 'total_amount')),
+                amounts)
+
+    def test_cart_changes(self):
+        self.assert_lists({'мука': 200, 'молоко': 500})
+        ShoppingListItem.objects.add_recipe(self.users[0], self.recipe)
+        ShoppingListItem.objects.remove_recipe(self.users[0], self.recipe)
+        self.assert_lists({'мука': 200, 'молоко': 500})
+
+        for user in self.users:
+            ShoppingListItem.objects.remove_recipe(user, self.recipe)
+        self.assert_lists({})
+
+    def test_recipe_ingredient_saved(self):
+        recipe_ingredient = self.recipe.recipeingredients.get(
+            ingredient=self.flour)
+        recipe_ingredient.amount = 300
+        recipe_ingredient.save()
+        self.assert_lists({'мука': 300, 'молоко': 500})
+
+        recipe_ingredient.ingredient = self.eggs
+        recipe_ingredient.save()
+        self.assert_lists({'яйца': 300, 'молоко': 500})
+
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.flour, amount=50)
+        self.assert_lists({'мука': 50, 'яйца': 300, 'молоко': 500})
+
+    def test_recipe_ingredient_deleted(self):
+        self.recipe.recipeingredients.filter(ingredient=self.milk).delete()
+        self.assert_lists({'мука': 200})
+
+    def test_recipe_deleted(self):
+        self.recipe.delete()
+        self.assert_lists({})
+
+    def test_lists_match_carts(self):
+        self.recipe.recipeingredients.filter(ingredient=self.milk).update(
+            amount=1)
+        ShoppingListItem.objects.rebuild()
+        expected = sorted(ShoppingListItem.objects.calculate())
+        self.recipe.recipeingredients.get(ingredient=self.flour).delete()
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.flour, amount=200)
+        self.assertEqual(sorted(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount')), expected)
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Recipe.objects.create(
+            author=author, name='Суп', text='Описание', cooking_time=10,
+            image='recipes/images/recipe.png')
+
+    def test_queries_use_indexes(self):
+        disable_seqscan()
+        checks = get_plan_checks()
+        self.assertIn('recipe_pub_date_idx',
+                      [index for _, _, index in checks])
+        for title, queryset, index in checks:
+            with self.subTest(title):
+                # Every query runs, with or without an index to check.
+                list(queryset)
+                if index is not None:
+                    self.assertIn(index, queryset.explain())
+
+
+class ShortURLTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/recipe.png')
+            for number in range(3)
+        ]
+
+    def test_codes(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        self.assertEqual(get_new_hashes(ids),
+                         {pk: encode_recipe_id(pk) for pk in ids})
+
+    def test_taken_hashes_retried(self):
+        first, second, other = self.recipes
+        RecipeShortURL.objects.create(
+            recipe=other, hash=encode_recipe_id(first.pk))
+        RecipeShortURL.objects.create(
+            recipe=other, hash=encode_recipe_id(second.pk))
+        RecipeShortURL.objects.create(recipe=other, hash='x' * 8)
+
+        # A stored hash, then one repeated in the batch, then free ones.
+        generated = iter(['x' * 8, 'y' * 8, 'y' * 8, 'z' * 8])
+        with mock.patch('recipe.short_urls.generate_hash',
+                        lambda: next(generated)):
+            hashes = get_new_hashes([first.pk, second.pk])
+        self.assertEqual(sorted(hashes.values()), ['y' * 8, 'z' * 8])
+
+    def test_random_hashes(self):
+        recipe = self.recipes[0]
+        RecipeShortURL.objects.create(
+            recipe=self.recipes[1], hash=encode_recipe_id(recipe.pk))
+        hash = get_new_hashes([recipe.pk])[recipe.pk]
+        self.assertEqual(len(hash), SHORT_URL_MAX_LENGTH)
+        self.assertFalse(RecipeShortURL.objects.filter(hash=hash).exists())
+
+
+class ImportRecipesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def get_record(self, name, image):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 10,
+            'pub_date': '2024-01-01T00:00:00+00:00',
+            'author': 'author@example.com', 'image': image,
+            'tags': [{'name': 'Завтрак', 'slug': 'breakfast'}],
+            'ingredients': [{'name': 'соль', 'measurement_unit': 'г',
+                             'amount': 5}],
+            'short_links': [],
+        }
+
+    def write_export(self, directory, records, images=('soup.png',)):
+        os.makedirs(os.path.join(directory, 'images'))
+        for name in images:
+            with open(os.path.join(directory, 'images', name),
+                      'wb') as image:
+                image.write(b'image')
+        with open(os.path.join(directory, RECIPE_EXPORT_FILE), 'w',
+                  encoding='utf-8') as recipes_file:
+            for record in records:
+                recipes_file.write(json.dumps(record) + '\n')
+
+    def import_recipes(self, path):
+        stderr = StringIO()
+        call_command('import_recipes', path, verbosity=0,
+                     stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_missing_image_skipped(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            self.write_export(directory, [
+                self.get_record('Суп', 'images/soup.png'),
+                self.get_record('Каша', 'images/none.png')])
+            stderr = self.import_recipes(directory)
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)), ['Суп'])
+        self.assertIn('images/none.png', stderr)
+
+    def test_images_of_skipped_recipes_not_stored(self):
+        record = self.get_record('Суп', 'images/soup.png')
+        record['author'] = 'nobody@example.com'
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            self.write_export(directory, [record])
+            self.import_recipes(directory)
+            self.assertEqual(os.listdir(media_root), [])
+
+    def test_shared_image_transferred_once(self):
+        records = [self.get_record(name, 'images/soup.png')
+                   for name in ('Суп', 'Каша', 'Блины')]
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            source = os.path.join(directory, 'source')
+            self.write_export(source, records)
+            self.import_recipes(source)
+            images = os.path.join(media_root, 'recipes', 'images')
+            self.assertEqual(len(os.listdir(images)), 1)
+
+            export = os.path.join(directory, 'export')
+            call_command('export_recipes', export, verbosity=0,
+                         stdout=StringIO())
+            self.assertEqual(
+                os.listdir(os.path.join(export, 'images')), ['soup.png'])
+            tarball_path = os.path.join(directory, 'export.tar.gz')
+            call_command('export_recipes', tarball_path, verbosity=0,
+                         stdout=StringIO())
+            with tarfile.open(tarball_path) as tarball:
+                self.assertEqual(tarball.getnames(),
+                                 ['images/soup.png', RECIPE_EXPORT_FILE])
+
+            self.import_recipes(tarball_path)
+            self.assertEqual(len(os.listdir(images)), 2)
+            self.assertEqual(
+                Recipe.objects.values('image').distinct().count(), 2)
+
+
+class LoadIngredientsTests(TestCase):
+
+    def test_counts_inserted_rows(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', encoding='utf-8') as file:
+            file.write('соль,г\nсахар,г\nмука,г\n')
+            file.flush()
+            stdout = StringIO()
+            # As if another process inserted соль after the lookup.
+            with mock.patch.object(Ingredient.objects, 'filter',
+                                   return_value=Ingredient.objects.none()):
+                call_command('load_ingredients', file.name, verbosity=0,
+                             stdout=stdout, stderr=StringIO())
+
+        self.assertIn('Added 2 of 3 ingredients', stdout.getvalue())
+        self.assertEqual(Ingredient.objects.count(), 3)
@@ -1,14 +1,15 @@
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
 from django.urls import reverse
 
-from .models import RecipeShortURL
+from .short_urls import resolve_short_url
 
 
 def redirect_from_short_url(request, hash):
-    recipe_short_url = get_object_or_404(RecipeShortURL, hash=hash)
-    recipe_url = reverse('frontend-recipe-detail',
-                         kwargs={'pk': recipe_short_url.recipe.pk})
+    recipe_id = resolve_short_url(hash)
+    if recipe_id is None:
+        raise Http404('Short link not found')
+    recipe_url = reverse('frontend-recipe-detail', kwargs={'pk': recipe_id})
     return redirect(recipe_url)
 
 